@@ -1,33 +1,59 @@
 from django.contrib import admin
 from .models import Product, ProductReview, Order, Collection, ProductPosition
+from .pagination import EstimatedCountPaginator
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Список без COUNT(*) по всей таблице: оценка числа строк для пагинации и
+    без второго подсчета "всего" при фильтрации. Связи выбираются через
+    автодополнение, а не select со всеми строками.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
 
 
 class OrderInline(admin.TabularInline):
     model = ProductPosition
+    readonly_fields = ('price',)
+    autocomplete_fields = ('product',)
+    extra = 0
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
-    list_display = ('name', 'id')
+class ProductAdmin(LargeTableAdmin):
+    list_display = ('name', 'id', 'sku', 'price')
+    search_fields = ('name', 'sku')
 
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(LargeTableAdmin):
     inlines = [OrderInline]
-    list_display = ('id', 'status')
-    readonly_fields = ('order_sum', 'id')
+    list_display = ('id', 'creator', 'status', 'total', 'created_at')
+    list_select_related = ('creator',)
+    # вместо date_hierarchy: она считает Min/Max и годы по created_at через
+    # JOIN с родительской таблицей на каждой загрузке списка, а фильтр дат -
+    # готовые диапазоны без запросов
+    list_filter = ('status', 'created_at')
+    autocomplete_fields = ('creator',)
+    readonly_fields = ('total', 'id')
 
     def save_model(self, request, obj, form, change):
-        if not obj.creator:
+        if not obj.creator_id:
             obj.creator = request.user
         obj.save()
 
 
 @admin.register(ProductReview)
-class ReviewAdmin(admin.ModelAdmin):
-    pass
+class ReviewAdmin(LargeTableAdmin):
+    list_display = ('id', 'review_product', 'creator', 'rating', 'created_at')
+    list_select_related = ('review_product', 'creator')
+    list_filter = ('rating', 'created_at')
+    autocomplete_fields = ('review_product', 'creator')
 
 
 @admin.register(Collection)
-class CollectionAdmin(admin.ModelAdmin):
-    pass
+class CollectionAdmin(LargeTableAdmin):
+    list_display = ('title', 'id', 'product_count')
+    autocomplete_fields = ('products',)
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class AppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        # задачи очереди регистрируются при импорте модуля, в том числе в run_jobs
+        from . import imports  # noqa: F401
@@ -0,0 +1,67 @@
+"""
+PostgreSQL с пулом соединений на процесс (см. app.pool).
+
+    DATABASES['default']['ENGINE'] = 'app.backends.postgresql_pool'
+    DATABASES['default']['POOL'] = {'MIN_SIZE': 2, 'MAX_SIZE': 10, ...}
+
+``CONN_MAX_AGE`` оставляется равным 0: в конце запроса Django "закрывает"
+соединение, и оно возвращается в пул, а не разрывается.
+"""
+import psycopg2.extensions
+import psycopg2.extras
+from django.db.backends.postgresql import base
+
+from app.pool import get_pool
+
+from .creation import DatabaseCreation
+
+
+def connect(conn_params, options):
+    connection = base.Database.connect(**conn_params)
+    if 'isolation_level' in options and options['isolation_level'] != connection.isolation_level:
+        connection.set_session(isolation_level=options['isolation_level'])
+    psycopg2.extras.register_default_jsonb(conn_or_curs=connection, loads=lambda x: x)
+    return connection
+
+
+def check(connection):
+    if connection.closed:
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+    return True
+
+
+def reset(connection):
+    if connection.closed:
+        return False
+    transaction_status = connection.get_transaction_status()
+    if transaction_status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    if transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        connection.rollback()
+    return True
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def get_pool(self, conn_params):
+        options = self.settings_dict['OPTIONS']
+        key = (self.alias, tuple(sorted((name, str(value)) for name, value in conn_params.items())))
+        return get_pool(
+            key, self.settings_dict.get('POOL'),
+            connect=lambda: connect(conn_params, options), check=check, reset=reset,
+            close=lambda connection: connection.close(),
+        )
+
+    def get_new_connection(self, conn_params):
+        self.pool = self.get_pool(conn_params)
+        connection = self.pool.acquire()
+        self.isolation_level = self.settings_dict['OPTIONS'].get('isolation_level', connection.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.release(self.connection)
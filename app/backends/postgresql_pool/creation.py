@@ -0,0 +1,16 @@
+from django.db.backends.postgresql import creation
+
+from app.pool import close_pools
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    # PostgreSQL не удаляет и не клонирует базу, к которой есть подключения,
+    # поэтому простаивающие соединения пула закрываются заранее
+
+    def _clone_test_db(self, suffix, verbosity, keepdb=False):
+        close_pools(self.connection.alias)
+        super()._clone_test_db(suffix, verbosity, keepdb)
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        close_pools(self.connection.alias)
+        super()._destroy_test_db(test_database_name, verbosity)
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def get_cache():
+    return caches[getattr(settings, 'API_CACHE_ALIAS', 'default')]
+
+
+def version_key(namespace, pk=None):
+    if pk is None:
+        return 'api:{}:version'.format(namespace)
+    return 'api:{}:{}:version'.format(namespace, pk)
+
+
+def new_version():
+    # время в микросекундах: если ключ версии вытеснен из кэша, новая версия
+    # все равно больше прежних, и старые записи не отдаются снова
+    return time.time_ns() // 1000
+
+
+def get_versions(*keys):
+    cache = get_cache()
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        version = new_version()
+        for key in missing:
+            cache.add(key, version, None)
+        versions.update({key: version for key in missing}, **cache.get_many(missing))
+    return [versions[key] for key in keys]
+
+
+def bump_version(namespace, pk=None):
+    cache = get_cache()
+    key = version_key(namespace, pk)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, new_version(), None)
+
+
+def invalidate(namespace, pks=()):
+    """Сбрасывает кэш списка namespace и кэш указанных объектов."""
+    bump_version(namespace)
+    for pk in pks:
+        bump_version(namespace, pk)
+
+
+def make_etag(data):
+    body = json.dumps(data, cls=JSONEncoder, sort_keys=True, ensure_ascii=False)
+    return '"{}"'.format(hashlib.md5(body.encode('utf-8')).hexdigest())
+
+
+class CachedReadMixin:
+    """
+    Кэширует ответы list/retrieve для анонимных пользователей.
+
+    Ключ строится из ``cache_namespace``, номера версии и нормализованного
+    URL (путь + отсортированные query-параметры). Для list используется
+    версия всего namespace, для retrieve - только версия конкретного
+    объекта, поэтому запись сбрасывает только затронутые ключи (см. app.signals).
+    Поддерживается ETag / If-None-Match с ответом 304.
+    """
+    cache_namespace = None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, None, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        return self.cached_response(request, pk, super().retrieve, *args, **kwargs)
+
+    def get_cache_key(self, request, object_pk):
+        # list зависит от всего namespace, retrieve - только от своего объекта:
+        # запись другого объекта карточку из кэша не вытесняет
+        if object_pk is None:
+            key = version_key(self.cache_namespace)
+        else:
+            key = version_key(self.cache_namespace, object_pk)
+        version = get_versions(key)[0]
+        query = urlencode(sorted(request.query_params.lists()), doseq=True)
+        url = hashlib.md5('{}?{}'.format(request.path, query).encode('utf-8')).hexdigest()
+        return 'api:{}:v{}:{}'.format(self.cache_namespace, version, url)
+
+    def cached_response(self, request, object_pk, handler, *args, **kwargs):
+        if request.user.is_authenticated or not getattr(settings, 'API_CACHE_ENABLED', True):
+            return handler(request, *args, **kwargs)
+
+        cache = get_cache()
+        key = self.get_cache_key(request, object_pk)
+        entry = cache.get(key)
+        if entry is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            entry = {
+                'data': response.data,
+                'etag': make_etag(response.data),
+                'link': response.get('Link'),
+            }
+            cache.set(key, entry, getattr(settings, 'API_CACHE_TIMEOUT', 300))
+
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+        if entry['etag'] in [tag.strip() for tag in if_none_match.split(',')]:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': entry['etag']})
+
+        headers = {'ETag': entry['etag']}
+        if entry['link']:
+            headers['Link'] = entry['link']
+        return Response(entry['data'], headers=headers)
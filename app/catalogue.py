@@ -0,0 +1,161 @@
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+
+from .models import RATINGS, Product
+
+logger = logging.getLogger('app.catalogue')
+
+RECORD_FIELDS = (
+    'id', 'sku', 'name', 'desc', 'price', 'created_at', 'updated_at', 'review_count', 'rating_avg',
+) + tuple('rating_{}'.format(rating) for rating in RATINGS)
+
+
+class ProductRecord:
+    """Компактная копия товара для чтения: поля ProductSerializer без служебных."""
+    __slots__ = RECORD_FIELDS
+
+    def __init__(self, values):
+        for field, value in zip(RECORD_FIELDS, values):
+            setattr(self, field, value)
+
+    @property
+    def pk(self):
+        return self.id
+
+    @property
+    def rating_histogram(self):
+        return {rating: getattr(self, 'rating_{}'.format(rating)) for rating in RATINGS}
+
+
+def is_enabled():
+    return getattr(settings, 'CATALOGUE_CACHE_ENABLED', True)
+
+
+class Catalogue:
+    """
+    Снимок каталога товаров в памяти процесса. Загружается целиком при
+    старте WSGI/ASGI-приложения (django_api/wsgi.py) или при первом обращении, затем не чаще раза в
+    ``CATALOGUE_REFRESH_SECONDS`` догружает товары с новым ``updated_at``
+    и убирает удаленные. Изменения в своем процессе сбрасываются сигналами
+    сразу и после коммита (app.signals).
+    """
+
+    def __init__(self):
+        self._refresh_lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self._records = {}
+        self._loaded = False
+        self._synced_until = None
+        self._checked_at = 0
+        self.hits = self.misses = self.refreshes = 0
+
+    def load(self):
+        rows = Product.objects.values_list(*RECORD_FIELDS)
+        self._records = {row[0]: ProductRecord(row) for row in rows.iterator()}
+        self._synced_until = max((record.updated_at for record in self._records.values()), default=None)
+        self._loaded = True
+        self._checked_at = time.monotonic()
+        return len(self._records)
+
+    def refresh(self):
+        """Догружает изменения с момента прошлой синхронизации и удаляет пропавшие товары."""
+        queryset = Product.objects.values_list(*RECORD_FIELDS)
+        if self._synced_until is not None:
+            # перекрытие на случай транзакций, закоммиченных позже своего updated_at
+            overlap = timedelta(seconds=getattr(settings, 'CATALOGUE_REFRESH_OVERLAP', 60))
+            queryset = queryset.filter(updated_at__gte=self._synced_until - overlap)
+        changed = [ProductRecord(row) for row in queryset]
+        for record in changed:
+            self._records[record.id] = record
+        if changed:
+            latest = max(record.updated_at for record in changed)
+            self._synced_until = max(latest, self._synced_until or latest)
+
+        if Product.objects.count() != len(self._records):
+            existing = set(Product.objects.values_list('pk', flat=True))
+            for pk in set(self._records.copy()) - existing:
+                self._records.pop(pk, None)
+        self.refreshes += 1
+
+    def ensure_fresh(self):
+        if self._loaded and time.monotonic() - self._checked_at < getattr(settings, 'CATALOGUE_REFRESH_SECONDS', 5):
+            return
+        # обновляет один поток, остальные пока читают текущий снимок
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            if self._loaded:
+                self.refresh()
+                self._checked_at = time.monotonic()
+            else:
+                self.load()
+        finally:
+            self._refresh_lock.release()
+
+    def get_many(self, ids):
+        """Записи по id; отсутствующие в снимке читаются одним запросом и добавляются в него."""
+        ids = set(ids)
+        if not is_enabled():
+            return {row[0]: ProductRecord(row) for row in Product.objects.filter(pk__in=ids).values_list(*RECORD_FIELDS)}
+
+        self.ensure_fresh()
+        found = {pk: self._records[pk] for pk in ids if pk in self._records}
+        self.hits += len(found)
+        missing = ids - set(found)
+        if missing:
+            self.misses += len(missing)
+            for row in Product.objects.filter(pk__in=missing).values_list(*RECORD_FIELDS):
+                found[row[0]] = self._records[row[0]] = ProductRecord(row)
+        return found
+
+    def get(self, pk):
+        return self.get_many([pk]).get(pk)
+
+    def evict(self, pks):
+        for pk in pks:
+            self._records.pop(pk, None)
+
+    def stats(self):
+        return {
+            'loaded': self._loaded,
+            'records': len(self._records),
+            'hits': self.hits,
+            'misses': self.misses,
+            'refreshes': self.refreshes,
+        }
+
+
+catalogue = Catalogue()
+
+
+def evict_products(pks):
+    # второй сброс после коммита: до него конкурентный запрос мог перечитать старую строку
+    pks = list(pks)
+    catalogue.evict(pks)
+    transaction.on_commit(lambda: catalogue.evict(pks))
+
+
+def warm_catalogue():
+    """Загрузка при старте WSGI/ASGI-процесса; при ошибке БД снимок загрузится при первом обращении."""
+    if not is_enabled():
+        return
+    connection = connections[DEFAULT_DB_ALIAS]
+    if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+        # SQLite в памяти (тесты) не закрывает соединение, и тестовая БД создалась бы в нем
+        return
+    try:
+        count = catalogue.load()
+    except DatabaseError as exc:
+        logger.warning('Каталог не загружен при старте: %s', exc)
+    else:
+        logger.info('Каталог загружен: %s товаров', count)
+    finally:
+        # соединение, открытое до fork (gunicorn --preload), не должно достаться воркерам
+        connections.close_all()
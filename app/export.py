@@ -0,0 +1,101 @@
+import csv
+import json
+
+from django.db.models import prefetch_related_objects
+from django.http import StreamingHttpResponse
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.utils.encoders import JSONEncoder
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def iter_chunks(queryset, chunk_size, prefetch=()):
+    # iterator() читает строки серверным курсором (PostgreSQL), а prefetch_related
+    # выполняется отдельно для каждой пачки, поэтому память не зависит от объема выгрузки
+    chunk = []
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(obj)
+        if len(chunk) == chunk_size:
+            prefetch_related_objects(chunk, *prefetch)
+            yield chunk
+            chunk = []
+    if chunk:
+        prefetch_related_objects(chunk, *prefetch)
+        yield chunk
+
+
+def csv_rows(record, fields):
+    """
+    Плоские строки CSV для одной записи. Поля вида ``positions.quantity``
+    берутся из вложенного списка, и на каждый его элемент выводится строка.
+    """
+    flat = [field for field in fields if '.' not in field]
+    nested = [field for field in fields if '.' in field]
+    base = {field: record.get(field) for field in flat}
+    if not nested:
+        yield [base[field] for field in fields]
+        return
+
+    source = nested[0].split('.', 1)[0]
+    items = record.get(source) or [{}]
+    for item in items:
+        row = dict(base)
+        row.update({field: item.get(field.split('.', 1)[1]) for field in nested})
+        yield [row[field] for field in fields]
+
+
+class ExportMixin:
+    """
+    Потоковая выгрузка ``GET <prefix>/export/?export_format=ndjson|csv``
+    с учетом фильтров viewset'а. Строки читаются пачками по
+    ``export_chunk_size``, связанные объекты из ``export_prefetch``
+    подгружаются для каждой пачки.
+    """
+    export_chunk_size = 2000
+    export_prefetch = ()
+    export_csv_fields = ()
+
+    def get_export_queryset(self):
+        queryset = self.filter_queryset(self.get_queryset()).order_by('pk')
+        # prefetch_related выполняется по пачкам в iter_chunks
+        return queryset.prefetch_related(None)
+
+    def export_chunks(self):
+        serializer_class = self.get_serializer_class()
+        context = self.get_serializer_context()
+        for chunk in iter_chunks(self.get_export_queryset(), self.export_chunk_size, self.export_prefetch):
+            yield serializer_class(chunk, many=True, context=context).data
+
+    def stream_ndjson(self):
+        for records in self.export_chunks():
+            yield ''.join(json.dumps(record, cls=JSONEncoder, ensure_ascii=False) + '\n' for record in records)
+
+    def stream_csv(self):
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.export_csv_fields)
+        for records in self.export_chunks():
+            yield ''.join(
+                writer.writerow(row)
+                for record in records
+                for row in csv_rows(record, self.export_csv_fields)
+            )
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        export_format = request.query_params.get('export_format', 'ndjson')
+        if export_format not in CONTENT_TYPES:
+            raise ValidationError({'export_format': 'Допустимые значения: {}'.format(', '.join(CONTENT_TYPES))})
+
+        stream = self.stream_csv() if export_format == 'csv' else self.stream_ndjson()
+        response = StreamingHttpResponse(stream, content_type=CONTENT_TYPES[export_format])
+        response['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(self.basename, export_format)
+        return response
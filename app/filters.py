@@ -1,6 +1,24 @@
+import re
+
 from django.contrib.auth import get_user_model
+from django.db.models import Exists, OuterRef, Q
 from django_filters import rest_framework as filters
-from .models import Product, Order, ProductReview
+from rest_framework.exceptions import ValidationError
+from .models import Product, Order, ProductPosition, ProductReview
+from .search import search_products
+
+MAX_PRODUCTS_FILTER = 100
+# id товара - AutoField (integer): большие числа не могут быть id
+MAX_PK = 2 ** 31 - 1
+PK_RE = re.compile(r'[0-9]+')
+
+
+class CharInFilter(filters.BaseInFilter, filters.CharFilter):
+    pass
+
+
+class NumberInFilter(filters.BaseInFilter, filters.NumberFilter):
+    pass
 
 
 class ProductFilter(filters.FilterSet):
@@ -8,26 +26,53 @@ class ProductFilter(filters.FilterSet):
     desc = filters.CharFilter(lookup_expr='icontains')
     price_from = filters.NumberFilter(field_name='price', lookup_expr='gt')
     price_to = filters.NumberFilter(field_name='price', lookup_expr='lt')
+    search = filters.CharFilter(method='filter_search')
+    min_rating = filters.NumberFilter(field_name='rating_avg', lookup_expr='gte')
 
     class Meta:
         model = Product
         fields = ('name', 'desc', 'price')
 
+    def filter_search(self, queryset, name, value):
+        return search_products(queryset, value)
+
 
 class OrderFilter(filters.FilterSet):
     created_at = filters.DateFromToRangeFilter()
     updated_at = filters.DateFromToRangeFilter()
     status = filters.ChoiceFilter(choices=Order.STATUS)
+    open = filters.BooleanFilter(method='filter_open')
 
-    products = filters.ModelMultipleChoiceFilter(
-        field_name="names",
-        to_field_name="name",
-        queryset=Product.objects.all()
-    )
+    products = CharInFilter(method='filter_products')
 
     class Meta:
         model = Order
-        fields = ('id', 'status', 'created_at', 'updated_at', 'products')
+        fields = ('id', 'status', 'created_at', 'updated_at', 'products', 'open')
+
+    def filter_open(self, queryset, name, value):
+        # условие совпадает с частичным индексом order_open_status_idx
+        if value:
+            return queryset.filter(status__in=Order.OPEN_STATUSES)
+        return queryset.exclude(status__in=Order.OPEN_STATUSES)
+
+    def filter_products(self, queryset, name, values):
+        # ?products=12,Чайник: числа - id товаров, остальное - точные названия.
+        # Один EXISTS по позициям: без загрузки товаров и без дублей заказов
+        values = [value.strip() for value in values if value.strip()]
+        if not values:
+            return queryset
+        if len(values) > MAX_PRODUCTS_FILTER:
+            raise ValidationError({name: 'Не больше {} товаров'.format(MAX_PRODUCTS_FILTER)})
+        # только ASCII-цифры: str.isdigit() пропускает '²', на котором падает int()
+        is_pk = [bool(PK_RE.fullmatch(value)) and int(value) <= MAX_PK for value in values]
+        ids = [int(value) for value, pk in zip(values, is_pk) if pk]
+        names = [value for value, pk in zip(values, is_pk) if not pk]
+        condition = Q(pk__in=[])
+        if ids:
+            condition |= Q(product_id__in=ids)
+        if names:
+            condition |= Q(product__name__in=names)
+        return queryset.filter(Exists(ProductPosition.objects.filter(condition, order=OuterRef('pk'))))
 
 
 class ReviewFilter(filters.FilterSet):
@@ -43,3 +88,11 @@ class ReviewFilter(filters.FilterSet):
         model = ProductReview
         fields = ('id', 'review_product', 'created_at')
 
+
+
+class SalesFilter(filters.FilterSet):
+    # без Meta.model: один набор фильтров для DailySales и HourlySales
+    date_from = filters.IsoDateTimeFilter(field_name='period', lookup_expr='gte')
+    date_to = filters.IsoDateTimeFilter(field_name='period', lookup_expr='lt')
+    product = NumberInFilter(field_name='product_id')
+    status = filters.ChoiceFilter(choices=Order.STATUS)
@@ -0,0 +1,257 @@
+import codecs
+import csv
+import json
+import time
+import uuid
+from itertools import islice
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from .catalogue import evict_products
+from .jobs import create_job, set_result, task
+from .models import Collection, Job, Product, TimestampFields
+from .reports import mark_sales
+from .search import index_products
+from .signals import invalidate_cache
+
+FORMATS = ('csv', 'ndjson')
+# в CSV id подборок перечисляются через "|"
+COLLECTIONS_SEPARATOR = '|'
+UPDATE_FIELDS = ('name', 'desc', 'price')
+IMPORT_TASK = 'catalogue.import'
+
+
+class ProductImportSerializer(serializers.Serializer):
+    sku = serializers.CharField(max_length=64)
+    name = serializers.CharField(max_length=50)
+    desc = serializers.CharField(max_length=200, allow_blank=True, default='')
+    price = serializers.DecimalField(max_digits=15, decimal_places=2, min_value=0)
+    collections = serializers.ListField(child=serializers.IntegerField(min_value=1), default=list)
+
+
+def read_csv(stream):
+    """Строки CSV как (номер строки, словарь); заголовок - названия полей."""
+    for line, row in enumerate(csv.DictReader(stream), start=2):
+        collections = row.get('collections') or ''
+        row['collections'] = [value for value in collections.split(COLLECTIONS_SEPARATOR) if value.strip()]
+        yield line, row
+
+
+def read_ndjson(stream):
+    for line, text in enumerate(stream, start=1):
+        if not text.strip():
+            continue
+        try:
+            yield line, json.loads(text)
+        except ValueError as exc:
+            yield line, exc
+
+
+class ImportReport:
+    """
+    Счетчики импорта, скорость и ошибки по строкам (хранится не больше
+    ``max_errors``). ``superseded`` - строки, замененные строкой с тем же
+    артикулом ниже в той же пачке; rows = created + updated + unchanged +
+    failed + superseded.
+    """
+    max_errors = 1000
+
+    def __init__(self):
+        self.rows = self.created = self.updated = self.unchanged = self.failed = self.superseded = 0
+        self.errors = []
+        self.started = time.monotonic()
+
+    def error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'error': message})
+
+    def as_dict(self, with_errors=True):
+        elapsed = time.monotonic() - self.started
+        stats = {
+            'rows': self.rows,
+            'created': self.created,
+            'updated': self.updated,
+            'unchanged': self.unchanged,
+            'failed': self.failed,
+            'superseded': self.superseded,
+            'elapsed_s': round(elapsed, 3),
+            'rows_per_second': round(self.rows / elapsed, 1) if elapsed else None,
+        }
+        if with_errors:
+            stats['errors'] = self.errors
+        return stats
+
+
+def validate_chunk(rows, report):
+    """Проверенные строки пачки по артикулу (последняя строка с артикулом заменяет предыдущие)."""
+    valid = {}
+    for line, data in rows:
+        report.rows += 1
+        if isinstance(data, Exception) or not isinstance(data, dict):
+            report.error(line, 'Ожидается JSON-объект: {}'.format(data))
+            continue
+        serializer = ProductImportSerializer(data=data)
+        if not serializer.is_valid():
+            report.error(line, serializer.errors)
+            continue
+        sku = serializer.validated_data['sku']
+        if sku in valid:
+            report.superseded += 1
+        valid[sku] = (line, serializer.validated_data)
+
+    collection_ids = {pk for _, item in valid.values() for pk in item['collections']}
+    existing = set(Collection.objects.filter(pk__in=collection_ids).values_list('pk', flat=True))
+    for sku, (line, item) in list(valid.items()):
+        missing = sorted(set(item['collections']) - existing)
+        if missing:
+            report.error(line, {'collections': 'Нет подборок: {}'.format(', '.join(map(str, missing)))})
+            del valid[sku]
+    return valid
+
+
+def insert_products(items):
+    """
+    Вставка новых товаров пачкой. Product наследует TimestampFields
+    (multi-table), и bulk_create для него недоступен: сначала родительские
+    строки, затем строки товаров с полученными id одним executemany.
+    """
+    now = timezone.now()
+    parents = [TimestampFields(created_at=now, updated_at=now) for _ in items]
+    if connection.features.can_return_rows_from_bulk_insert:
+        TimestampFields.objects.bulk_create(parents)
+    else:
+        # без RETURNING (SQLite) id новых строк известны только при вставке по одной
+        for parent in parents:
+            parent.save(force_insert=True)
+    products = [
+        Product(timestampfields_ptr_id=parent.pk, sku=item['sku'], name=item['name'], desc=item['desc'],
+                price=item['price'])
+        for parent, item in zip(parents, items)
+    ]
+    fields = Product._meta.local_concrete_fields
+    quote = connection.ops.quote_name
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        quote(Product._meta.db_table), ', '.join(quote(field.column) for field in fields), ', '.join(['%s'] * len(fields)),
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            [field.get_db_prep_save(getattr(product, field.attname), connection) for field in fields]
+            for product in products
+        ])
+    return [parent.pk for parent in parents]
+
+
+def import_chunk(valid, report):
+    existing = {
+        row[0]: row for row in Product.objects.filter(sku__in=valid).values_list('sku', 'pk', *UPDATE_FIELDS)
+    }
+    changed, new, price_changed = [], [], []
+    unchanged = 0
+    for sku, (line, item) in valid.items():
+        if sku not in existing:
+            new.append(item)
+            continue
+        _, pk, *values = existing[sku]
+        if values == [item[field] for field in UPDATE_FIELDS]:
+            unchanged += 1
+            continue
+        changed.append(Product(pk=pk, **{field: item[field] for field in UPDATE_FIELDS}))
+        if values[UPDATE_FIELDS.index('price')] != item['price']:
+            price_changed.append(pk)
+
+    with transaction.atomic():
+        pks = {}
+        if changed:
+            Product.objects.bulk_update(changed, UPDATE_FIELDS)
+            Product.objects.filter(pk__in=[product.pk for product in changed]).touch()
+        if new:
+            pks.update(zip((item['sku'] for item in new), insert_products(new)))
+        pks.update((sku, existing[sku][1]) for sku in existing)
+        touched = [product.pk for product in changed] + [pks[item['sku']] for item in new]
+        index_products(touched)
+
+        through = Collection.products.through
+        memberships = [
+            through(collection_id=collection_id, product_id=pks[sku])
+            for sku, (_, item) in valid.items() for collection_id in item['collections']
+        ]
+        through.objects.bulk_create(memberships, ignore_conflicts=True)
+        collection_ids = {membership.collection_id for membership in memberships}
+        Collection.objects.filter(pk__in=collection_ids).update_product_counts()
+
+        if price_changed:
+            mark_sales(order_ids=Product.objects.filter(pk__in=price_changed).sync_open_positions())
+        evict_products([product.pk for product in changed])
+        if touched:
+            invalidate_cache('products', [product.pk for product in changed])
+        if collection_ids:
+            invalidate_cache('collections', collection_ids)
+
+    report.created += len(new)
+    report.updated += len(changed)
+    report.unchanged += unchanged
+
+
+def import_products(stream, import_format='csv', chunk_size=1000, progress=None):
+    """
+    Потоковый импорт товаров из CSV/NDJSON пачками по ``chunk_size`` строк:
+    вставка новых и обновление измененных по артикулу ``sku``, добавление в
+    подборки (``collections``). Ошибки строк попадают в отчет и не
+    прерывают импорт; ошибка БД откатывает только свою пачку.
+    ``progress(report)`` вызывается после каждой пачки.
+    """
+    rows = read_csv(stream) if import_format == 'csv' else read_ndjson(stream)
+    report = ImportReport()
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        valid = validate_chunk(chunk, report)
+        try:
+            import_chunk(valid, report)
+        except DatabaseError as exc:
+            for line, _ in valid.values():
+                report.error(line, 'Ошибка БД, пачка отменена: {}'.format(exc))
+        if progress is not None:
+            progress(report)
+    return report
+
+
+def import_storage():
+    # файлы ждут воркер run_jobs: при нескольких серверах каталог должен быть общим
+    return FileSystemStorage(location=settings.CATALOGUE_IMPORT_DIR)
+
+
+def queue_import(upload, import_format, chunk_size=1000):
+    """Сохраняет загруженный файл и ставит задачу импорта; файл удаляет сама задача."""
+    path = import_storage().save('catalogue-{}.{}'.format(uuid.uuid4().hex, import_format), upload)
+    return create_job(IMPORT_TASK, path=path, import_format=import_format, chunk_size=chunk_size)
+
+
+@task(IMPORT_TASK, max_attempts=1)
+def import_file(path, import_format, chunk_size):
+    """Импорт сохраненного файла; счетчики после каждой пачки и итоговый отчет - в Job.result."""
+    storage = import_storage()
+    try:
+        with storage.open(path, 'rb') as upload:
+            report = import_products(codecs.iterdecode(upload, 'utf-8-sig'), import_format, chunk_size,
+                                     lambda report: set_result(report.as_dict(with_errors=False)))
+        set_result(report.as_dict())
+    finally:
+        storage.delete(path)
+
+
+def import_job_state(job):
+    return {
+        'job': job.pk,
+        'status': job.status,
+        'created_at': job.created_at,
+        'finished_at': job.finished_at,
+        'report': job.result,
+        'error': job.last_error.strip().splitlines()[-1] if job.status == Job.FAILED and job.last_error else None,
+    }
@@ -0,0 +1,203 @@
+import logging
+import os
+import socket
+import time
+import traceback
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger('app.jobs')
+
+TASKS = {}
+
+# задача, которую выполняет текущий поток: для set_result()
+current_job = ContextVar('current_job', default=None)
+
+JOB_DEFAULTS = {
+    'RETRY_DELAY': 5,
+    'STALE_AFTER': 600,
+}
+
+
+def task(name, max_attempts=3):
+    """Регистрирует функцию как задачу очереди; аргументы задачи - JSON."""
+    def register(func):
+        TASKS[name] = (func, max_attempts)
+        return func
+    return register
+
+
+def create_job(name, key=None, delay=0, **payload):
+    """
+    Ставит задачу сразу. Если задача с тем же ``key`` уже ждет в очереди,
+    новая не создается (уникальный индекс по ключу ожидающих задач).
+    """
+    if name not in TASKS:
+        raise ValueError('Неизвестная задача: {}'.format(name))
+    try:
+        with transaction.atomic():
+            return Job.objects.create(name=name, key=key, payload=payload, max_attempts=TASKS[name][1],
+                                      run_at=timezone.now() + timedelta(seconds=delay))
+    except IntegrityError:
+        if key is not None and Job.objects.filter(key=key, status=Job.QUEUED).exists():
+            return None
+        raise
+
+
+def claim(worker, limit):
+    """
+    Забирает до ``limit`` готовых задач: условный UPDATE по статусу, так что
+    задачу получает только один воркер. На PostgreSQL строки, занятые другим
+    воркером, пропускаются (SKIP LOCKED), а не ждут его транзакции.
+    """
+    token = '{}:{}'.format(worker, uuid.uuid4().hex[:8])
+    now = timezone.now()
+    with transaction.atomic():
+        ready = Job.objects.filter(status=Job.QUEUED, run_at__lte=now).order_by('run_at', 'pk')
+        if connection.features.has_select_for_update_skip_locked:
+            ready = ready.select_for_update(skip_locked=True)
+        pks = list(ready.values_list('pk', flat=True)[:limit])
+        if not pks:
+            return []
+        Job.objects.filter(pk__in=pks, status=Job.QUEUED).update(
+            status=Job.RUNNING, locked_by=token, locked_at=now, attempts=F('attempts') + 1,
+        )
+    return list(Job.objects.filter(locked_by=token, status=Job.RUNNING).order_by('run_at', 'pk'))
+
+
+def finish(job, **fields):
+    """
+    Записывает итог задачи, только если она все еще за этим воркером: зависшую
+    задачу requeue_stale мог вернуть в очередь, и ее уже выполняет другой.
+    """
+    updated = Job.objects.filter(pk=job.pk, locked_by=job.locked_by).update(locked_by=None, **fields)
+    if not updated:
+        logger.warning('Задача %s #%s возвращена в очередь другим воркером, итог не записан', job.name, job.pk)
+    return updated
+
+
+def retry_or_fail(job, error):
+    now = timezone.now()
+    if job.attempts >= job.max_attempts or job.name not in TASKS:
+        finish(job, status=Job.FAILED, last_error=error, finished_at=now)
+        return Job.FAILED
+    delay = JOB_DEFAULTS['RETRY_DELAY'] * 2 ** (job.attempts - 1)
+    try:
+        with transaction.atomic():
+            finish(job, status=Job.QUEUED, last_error=error, run_at=now + timedelta(seconds=delay))
+    except IntegrityError:
+        # такая же задача уже ждет в очереди и сделает ту же работу
+        finish(job, status=Job.DONE, last_error=error, finished_at=now)
+        return Job.DONE
+    return Job.QUEUED
+
+
+def set_result(result):
+    """Прогресс или результат выполняемой задачи (JSON в Job.result), виден до ее завершения."""
+    job = current_job.get()
+    if job is not None:
+        Job.objects.filter(pk=job.pk, locked_by=job.locked_by).update(result=result)
+
+
+def run_job(job):
+    """Выполняет взятую задачу; ошибка - повтор с экспоненциальной задержкой или failed."""
+    token = current_job.set(job)
+    try:
+        func, _ = TASKS[job.name]
+        func(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        status = retry_or_fail(job, error)
+        logger.warning('Задача %s #%s: ошибка, попытка %s из %s -> %s', job.name, job.pk, job.attempts,
+                       job.max_attempts, status, exc_info=True)
+        return status
+    else:
+        finish(job, status=Job.DONE, finished_at=timezone.now())
+        return Job.DONE
+    finally:
+        current_job.reset(token)
+
+
+def run_job_in_thread(job):
+    try:
+        return run_job(job)
+    finally:
+        # потоки пула живут долго; соединение возвращается после каждой задачи
+        close_old_connections()
+
+
+def requeue_stale(stale_after=None):
+    """Возвращает в очередь задачи упавших воркеров (running дольше ``stale_after`` секунд)."""
+    stale_after = stale_after or JOB_DEFAULTS['STALE_AFTER']
+    now = timezone.now()
+    stale = Job.objects.filter(status=Job.RUNNING, locked_at__lt=now - timedelta(seconds=stale_after))
+    queued_keys = Job.objects.filter(status=Job.QUEUED, key__isnull=False).values('key')
+    with transaction.atomic():
+        covered = stale.filter(key__in=queued_keys).update(status=Job.DONE, finished_at=now, locked_by=None)
+        # ключ уникален только среди ожидающих задач: из зависших с одним ключом
+        # в очередь возвращается одна, остальные ее дублируют
+        first = stale.filter(key__isnull=False).order_by().values('key').annotate(first=Min('pk')).values('first')
+        covered += stale.filter(key__isnull=False).exclude(pk__in=first).update(
+            status=Job.DONE, finished_at=now, locked_by=None)
+        requeued = stale.update(status=Job.QUEUED, locked_by=None)
+    return requeued + covered
+
+
+def job_stats():
+    stats = {status: 0 for status, _ in Job.STATUS}
+    stats.update(Job.objects.order_by().values('status').annotate(count=Count('pk')).values_list('status', 'count'))
+    return stats
+
+
+class Worker:
+    """
+    Воркер очереди: не больше ``concurrency`` задач одновременно в пуле
+    потоков. При ``concurrency = 1`` задачи выполняются в текущем потоке.
+    """
+
+    def __init__(self, concurrency=1, name=None):
+        self.concurrency = concurrency
+        self.name = name or '{}:{}'.format(socket.gethostname(), os.getpid())
+        self.stopping = False
+
+    def run_once(self):
+        """Выполняет готовые задачи, пока они есть; возвращает число выполненных."""
+        done = 0
+        while not self.stopping:
+            jobs = claim(self.name, self.concurrency)
+            if not jobs:
+                break
+            if self.concurrency == 1:
+                run_job(jobs[0])
+            else:
+                with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                    list(executor.map(run_job_in_thread, jobs))
+            done += len(jobs)
+        return done
+
+    def run(self, poll_interval=1.0, stale_every=60):
+        """Постоянный цикл: свободные места пула сразу заполняются новыми задачами."""
+        running = set()
+        checked_at = 0
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while not self.stopping or running:
+                if not self.stopping and time.monotonic() - checked_at > stale_every:
+                    if requeue_stale():
+                        logger.info('Задачи упавших воркеров возвращены в очередь')
+                    checked_at = time.monotonic()
+                free = self.concurrency - len(running)
+                if free and not self.stopping:
+                    running.update(executor.submit(run_job_in_thread, job) for job in claim(self.name, free))
+                close_old_connections()
+                if running:
+                    _, running = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                else:
+                    time.sleep(poll_interval)
@@ -0,0 +1,200 @@
+import json
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from model_bakery import baker
+from rest_framework.test import APIClient
+
+from app.middleware import QueryCounter
+from app.models import Collection, Order, Product, ProductPosition, ProductReview
+
+
+def percentile(values, pct):
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[pct - 1]
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный прогон API в процессе: наполняет БД через model_bakery, выполняет '
+        'list/retrieve/filter/create для каждого viewset и сохраняет p50/p95/p99, число '
+        'запросов к БД и пиковую память в JSON. Данные откатываются после прогона.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--orders', type=int, default=500)
+        parser.add_argument('--positions', type=int, default=5000)
+        parser.add_argument('--reviews', type=int, default=2000)
+        parser.add_argument('--collections', type=int, default=50)
+        parser.add_argument('--requests', type=int, default=100, help='Запросов на сценарий')
+        parser.add_argument('--output', default=None, help='Файл для JSON с результатами')
+        parser.add_argument('--compare', default=None, help='JSON предыдущего прогона для сравнения')
+
+    def handle(self, *args, **options):
+        # ALLOWED_HOSTS для testserver и DEBUG=False, как в тестах
+        try:
+            setup_test_environment()
+        except RuntimeError:
+            own_environment = False
+        else:
+            own_environment = True
+        try:
+            with override_settings(QUERY_BUDGET_ENABLED=False):
+                results = self.run(options)
+        finally:
+            if own_environment:
+                teardown_test_environment()
+
+        output = options['output'] or 'benchmark-{}.json'.format((results['meta']['revision'] or 'local')[:12])
+        with open(output, 'w') as fp:
+            json.dump(results, fp, indent=2, ensure_ascii=False)
+        self.stdout.write(self.style.SUCCESS('Результаты записаны в {}'.format(output)))
+
+        if options['compare']:
+            with open(options['compare']) as fp:
+                self.compare(json.load(fp), results)
+
+    def run(self, options):
+        results = {}
+        try:
+            with transaction.atomic():
+                context = self.seed(options)
+                for name, method, url, data in self.scenarios(context):
+                    results[name] = self.measure(context['client'], method, url, data, options['requests'])
+                    self.stdout.write('{:<28} p50={p50_ms:>8} p95={p95_ms:>8} p99={p99_ms:>8} '
+                                      'queries={queries_per_request:>6} errors={errors}'.format(name, **results[name]))
+                raise Rollback
+        except Rollback:
+            pass
+
+        return {
+            'meta': {
+                'revision': git_revision(),
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'volumes': {key: options[key] for key in ('products', 'orders', 'positions', 'reviews', 'collections')},
+                'requests_per_scenario': options['requests'],
+            },
+            'scenarios': results,
+        }
+
+    def seed(self, options):
+        started = time.perf_counter()
+        admin = get_user_model().objects.create_superuser('benchmark', 'benchmark@example.com', 'benchmark')
+        # модели с наследованием от TimestampFields нельзя вставлять через bulk_create
+        products = baker.make(Product, _quantity=options['products'])
+        orders = baker.make(Order, creator=admin, status='new', _quantity=options['orders'])
+        baker.make(Collection, _quantity=options['collections'])
+        users = baker.make(get_user_model(), _quantity=max(1, options['reviews'] // max(1, len(products))) + 1)
+        reviews = [
+            ProductReview(review_product=products[i % len(products)], creator=users[i // len(products)],
+                          text='benchmark', rating=i % 5 + 1)
+            for i in range(options['reviews'])
+        ]
+        for review in reviews:
+            review.save()
+
+        positions = [
+            ProductPosition(order=orders[i % len(orders)], product=products[i % len(products)],
+                            price=products[i % len(products)].price, quantity=1)
+            for i in range(options['positions'])
+        ]
+        ProductPosition.objects.bulk_create(positions, batch_size=5000)
+        Order.objects.update_totals()
+        Product.objects.rebuild_rating_aggregates()
+        self.stdout.write('Данные созданы за {:.1f} c'.format(time.perf_counter() - started))
+
+        client = APIClient()
+        client.force_authenticate(admin)
+        return {'client': client, 'admin': admin, 'product': products[0], 'order': orders[0],
+                'review': reviews[0] if reviews else None, 'collection': Collection.objects.first()}
+
+    def scenarios(self, context):
+        product, order = context['product'], context['order']
+        yield 'products-list', 'get', reverse('products-list'), None
+        yield 'products-retrieve', 'get', reverse('products-detail', args=(product.pk,)), None
+        yield 'products-filter', 'get', reverse('products-list'), {'price_from': 10, 'min_rating': 3}
+        yield 'products-search', 'get', reverse('products-list'), {'search': product.name[:5]}
+        yield 'products-create', 'post', reverse('products-list'), {'name': 'bench', 'desc': 'bench', 'price': 10}
+        yield 'orders-list', 'get', reverse('orders-list'), None
+        yield 'orders-retrieve', 'get', reverse('orders-detail', args=(order.pk,)), None
+        yield 'orders-filter', 'get', reverse('orders-list'), {'status': 'new'}
+        yield 'orders-create', 'post', reverse('orders-list'), {
+            'positions': [{'product_id': product.pk, 'quantity': 1}],
+        }
+        yield 'reviews-list', 'get', reverse('reviews-list'), None
+        if context['review'] is not None:
+            yield 'reviews-retrieve', 'get', reverse('reviews-detail', args=(context['review'].pk,)), None
+        yield 'reviews-filter', 'get', reverse('reviews-list'), {'review_product': product.pk}
+        yield 'collections-list', 'get', reverse('collections-list'), None
+        if context['collection'] is not None:
+            yield 'collections-retrieve', 'get', reverse('collections-detail', args=(context['collection'].pk,)), None
+        yield 'collections-create', 'post', reverse('collections-list'), {
+            'title': 'bench', 'text': 'bench', 'products': [product.pk],
+        }
+
+    def measure(self, client, method, url, data, requests):
+        call = getattr(client, method)
+        kwargs = {'format': 'json'} if method == 'post' else {}
+        latencies, queries, errors = [], [], 0
+        for _ in range(requests):
+            with QueryCounter() as counter:
+                started = time.perf_counter()
+                response = call(url, data, **kwargs)
+                latencies.append((time.perf_counter() - started) * 1000)
+            queries.append(counter.count)
+            if response.status_code >= 400:
+                errors += 1
+
+        tracemalloc.start()
+        call(url, data, **kwargs)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        return {
+            'requests': requests,
+            'errors': errors,
+            'mean_ms': round(statistics.mean(latencies), 3),
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'queries_per_request': round(statistics.mean(queries), 2),
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
+
+    def compare(self, previous, current):
+        self.stdout.write('Сравнение с {}'.format(previous['meta'].get('revision')))
+        for name, stats in current['scenarios'].items():
+            before = previous['scenarios'].get(name)
+            if before is None:
+                continue
+            self.stdout.write('{:<28} p95 {:>8} -> {:>8} ({:+.1f}%)  queries {} -> {}'.format(
+                name, before['p95_ms'], stats['p95_ms'],
+                (stats['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 if before['p95_ms'] else 0,
+                before['queries_per_request'], stats['queries_per_request'],
+            ))
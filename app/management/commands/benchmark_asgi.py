@@ -0,0 +1,110 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from .benchmark_api import git_revision, percentile
+
+DEFAULT_PATHS = ('/api/products/', '/api/collections/')
+
+
+def summary(latencies, elapsed, errors):
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает число запросов в секунду для GET list/retrieve через WSGI и ASGI '
+        'обработчики Django при одинаковой конкурентности: под WSGI запросы выполняют '
+        'N потоков (как gunicorn --threads N), под ASGI - N одновременных корутин в '
+        'одном цикле событий. View в обоих случаях синхронные: под ASGI Django '
+        'выполняет их через sync_to_async. Читает существующие данные; БД должна '
+        'быть наполнена (например, loaddata или benchmark_api на отдельной базе).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=400, help='Запросов на адрес')
+        parser.add_argument('--path', action='append', dest='paths', help='Адрес для проверки, можно несколько')
+        parser.add_argument('--output', default=None, help='Файл для JSON с результатами')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError('--concurrency и --requests должны быть положительными')
+        paths = options['paths'] or DEFAULT_PATHS
+
+        try:
+            setup_test_environment()
+        except RuntimeError:
+            own_environment = False
+        else:
+            own_environment = True
+        try:
+            with override_settings(QUERY_BUDGET_ENABLED=False):
+                results = {
+                    'meta': {
+                        'revision': git_revision(),
+                        'database': connection.vendor,
+                        'concurrency': options['concurrency'],
+                        'requests_per_path': options['requests'],
+                    },
+                    'wsgi': {},
+                    'asgi': {},
+                }
+                # соединение основного потока не должно держать блокировки во время прогона
+                connection.close()
+                for url in paths:
+                    results['wsgi'][url] = self.run_wsgi(url, options['concurrency'], options['requests'])
+                    results['asgi'][url] = async_to_sync(self.run_asgi)(url, options['concurrency'], options['requests'])
+                    self.stdout.write('{:<24} wsgi {:>8} rps  asgi {:>8} rps'.format(
+                        url, results['wsgi'][url]['rps'], results['asgi'][url]['rps']))
+        finally:
+            if own_environment:
+                teardown_test_environment()
+
+        if options['output']:
+            with open(options['output'], 'w') as fp:
+                json.dump(results, fp, indent=2, ensure_ascii=False)
+            self.stdout.write(self.style.SUCCESS('Результаты записаны в {}'.format(options['output'])))
+
+    def run_wsgi(self, url, concurrency, requests):
+        def call(_):
+            client = Client()
+            started = time.perf_counter()
+            response = client.get(url)
+            return (time.perf_counter() - started) * 1000, response.status_code
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            measured = list(executor.map(call, range(requests)))
+        elapsed = time.perf_counter() - started
+        return summary([latency for latency, _ in measured], elapsed,
+                       sum(1 for _, code in measured if code >= 400))
+
+    async def run_asgi(self, url, concurrency, requests):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def call():
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(url)
+                return (time.perf_counter() - started) * 1000, response.status_code
+
+        started = time.perf_counter()
+        measured = await asyncio.gather(*(call() for _ in range(requests)))
+        elapsed = time.perf_counter() - started
+        return summary([latency for latency, _ in measured], elapsed,
+                       sum(1 for _, code in measured if code >= 400))
@@ -0,0 +1,101 @@
+import re
+from itertools import combinations
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django_filters import filters
+
+from app.urls import router
+
+SEQ_SCAN_RE = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'sqlite': re.compile(r'\bSCAN (?:TABLE )?(\w+)(?!.*\b(?:USING|VIRTUAL TABLE)\b)'),
+}
+
+
+def sample_params(name, filter_):
+    if isinstance(filter_, filters.DateFromToRangeFilter):
+        return {name + '_after': '2021-01-01', name + '_before': '2021-12-31'}
+    if isinstance(filter_, filters.ModelMultipleChoiceFilter):
+        return None
+    if isinstance(filter_, filters.ModelChoiceFilter):
+        obj = filter_.queryset.order_by('pk').first()
+        return {name: str(obj.pk)} if obj is not None else None
+    if isinstance(filter_, filters.ChoiceFilter):
+        return {name: str(filter_.extra['choices'][0][0])}
+    if isinstance(filter_, filters.BooleanFilter):
+        return {name: 'true'}
+    if isinstance(filter_, filters.NumberFilter):
+        return {name: '100'}
+    if isinstance(filter_, filters.CharFilter):
+        return {name: 'test'}
+    return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Выполняет EXPLAIN для комбинаций фильтров каждого viewset и показывает '
+        'последовательные сканирования. Запускайте на БД с реальным объемом данных.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--depth', type=int, default=2, help='Максимальное число фильтров в комбинации')
+        parser.add_argument(
+            '--force-index', action='store_true',
+            help='PostgreSQL: SET enable_seqscan = off, чтобы Seq Scan означал отсутствие подходящего индекса'
+        )
+        parser.add_argument('--fail-on-seq-scan', action='store_true')
+
+    def handle(self, *args, **options):
+        pattern = SEQ_SCAN_RE.get(connection.vendor)
+        if pattern is None:
+            raise CommandError('EXPLAIN не поддерживается для {}'.format(connection.vendor))
+
+        seq_scans = 0
+        with transaction.atomic():
+            if options['force_index'] and connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+
+            for prefix, viewset, basename in router.registry:
+                filterset_class = getattr(viewset, 'filterset_class', None)
+                if filterset_class is None:
+                    continue
+                queryset = viewset.queryset.order_by(*viewset.ordering)
+                samples = {}
+                for name, filter_ in filterset_class.base_filters.items():
+                    params = sample_params(name, filter_)
+                    if params is None:
+                        self.stdout.write('[SKIP] {} {}: нет тестового значения'.format(prefix, name))
+                    else:
+                        samples[name] = params
+
+                for size in range(1, options['depth'] + 1):
+                    for names in combinations(sorted(samples), size):
+                        seq_scans += self.explain(prefix, viewset, filterset_class, queryset, samples, names, pattern)
+
+        if seq_scans and options['fail_on_seq_scan']:
+            raise CommandError('Найдено последовательных сканирований: {}'.format(seq_scans))
+
+    def explain(self, prefix, viewset, filterset_class, queryset, samples, names, pattern):
+        data = {}
+        for name in names:
+            data.update(samples[name])
+        label = '{} {}'.format(prefix, '&'.join('{}={}'.format(key, value) for key, value in sorted(data.items())))
+
+        filterset = filterset_class(data, queryset=queryset)
+        if not filterset.is_valid():
+            self.stdout.write('[SKIP] {}: {}'.format(label, dict(filterset.errors)))
+            return 0
+        try:
+            plan = filterset.qs[:viewset.page_size + 1].explain()
+        except Exception as exc:
+            self.stdout.write(self.style.ERROR('[ERROR] {}: {}'.format(label, exc)))
+            return 0
+
+        tables = sorted(set(match.group(1) for match in pattern.finditer(plan)))
+        if tables:
+            self.stdout.write(self.style.WARNING('[SEQ SCAN] {}: {}'.format(label, ', '.join(tables))))
+            return 1
+        self.stdout.write(self.style.SUCCESS('[OK] {}'.format(label)))
+        return 0
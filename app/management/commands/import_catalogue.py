@@ -0,0 +1,51 @@
+import json
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.imports import FORMATS, import_products
+
+
+class Command(BaseCommand):
+    help = (
+        'Потоковый импорт каталога товаров из CSV или NDJSON: товары по артикулу sku '
+        'создаются или обновляются пачками, id подборок из collections добавляются в '
+        'подборки. Колонки: sku, name, desc, price, collections (в CSV через "|").'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл каталога; "-" - стандартный ввод')
+        parser.add_argument('--format', dest='import_format', choices=FORMATS, default=None,
+                            help='По умолчанию - по расширению файла')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--output', default=None, help='Файл для JSON-отчета с ошибками строк')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size должен быть положительным')
+        path = options['path']
+        import_format = options['import_format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if import_format not in FORMATS:
+            raise CommandError('Укажите --format: {}'.format(', '.join(FORMATS)))
+
+        def progress(report):
+            stats = report.as_dict(with_errors=False)
+            self.stdout.write('строк {rows}: создано {created}, обновлено {updated}, без изменений {unchanged}, '
+                              'ошибок {failed}, повторов артикула {superseded}; '
+                              '{rows_per_second} строк/с'.format(**stats))
+
+        if path == '-':
+            report = import_products(sys.stdin, import_format, options['chunk_size'], progress)
+        else:
+            with open(path, encoding='utf-8-sig', newline='') as stream:
+                report = import_products(stream, import_format, options['chunk_size'], progress)
+
+        stats = report.as_dict()
+        for error in stats['errors'][:20]:
+            self.stderr.write('строка {line}: {error}'.format(**error))
+        if options['output']:
+            with open(options['output'], 'w') as fp:
+                json.dump(stats, fp, indent=2, ensure_ascii=False)
+        self.stdout.write(self.style.SUCCESS('Импорт завершен за {elapsed_s} с: создано {created}, обновлено {updated}, '
+                                             'ошибок {failed}'.format(**stats)))
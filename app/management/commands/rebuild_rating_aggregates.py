@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает агрегаты оценок товаров по таблице отзывов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        product_ids = Product.objects.order_by('pk').values_list('pk', flat=True)
+        last_id = 0
+        updated = 0
+        while True:
+            chunk = list(product_ids.filter(pk__gt=last_id)[:chunk_size])
+            if not chunk:
+                break
+            last_id = chunk[-1]
+            with transaction.atomic():
+                updated += Product.objects.filter(pk__in=chunk).rebuild_rating_aggregates()
+        self.stdout.write(self.style.SUCCESS('Пересчитано товаров: {}'.format(updated)))
@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from app.models import Order
+from app.reports import period_start, rebuild_sales
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает дневные и часовые сводки продаж по позициям заказов, по несколько дней за транзакцию'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-days', type=int, default=1)
+        parser.add_argument('--since', default=None, help='Первый день, YYYY-MM-DD (по умолчанию - первый заказ)')
+        parser.add_argument('--until', default=None, help='Последний день включительно, YYYY-MM-DD')
+
+    def handle(self, *args, **options):
+        if options['chunk_days'] < 1:
+            raise CommandError('--chunk-days должен быть положительным')
+        bounds = Order.objects.aggregate(first=Min('created_at'), last=Max('created_at'))
+        if bounds['first'] is None:
+            self.stdout.write(self.style.SUCCESS('Заказов нет'))
+            return
+        start = self.parse_day(options['since']) or period_start(bounds['first'], 'day')
+        until = self.parse_day(options['until'])
+        end = until + timedelta(days=1) if until else period_start(bounds['last'], 'day') + timedelta(days=1)
+
+        step = timedelta(days=options['chunk_days'])
+        chunks = 0
+        while start < end:
+            chunk_end = min(start + step, end)
+            with transaction.atomic():
+                rebuild_sales(start, chunk_end)
+            start = chunk_end
+            chunks += 1
+        self.stdout.write(self.style.SUCCESS('Пересчитано периодов по {} дн.: {}'.format(options['chunk_days'], chunks)))
+
+    def parse_day(self, value):
+        if value is None:
+            return None
+        try:
+            return timezone.make_aware(datetime.strptime(value, '%Y-%m-%d'))
+        except ValueError:
+            raise CommandError('Ожидается дата YYYY-MM-DD: {}'.format(value))
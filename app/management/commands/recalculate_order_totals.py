@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+
+from app.models import Order, Product, ProductPosition
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает сохраненные суммы заказов по позициям'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument(
+            '--sync-prices', action='store_true',
+            help='Обновить цены позиций незавершенных заказов по текущим ценам товаров'
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        order_ids = Order.objects.order_by('pk').values_list('pk', flat=True)
+        last_id = 0
+        updated = 0
+        while True:
+            chunk = list(order_ids.filter(pk__gt=last_id)[:chunk_size])
+            if not chunk:
+                break
+            last_id = chunk[-1]
+            with transaction.atomic():
+                if options['sync_prices']:
+                    ProductPosition.objects.filter(order_id__in=chunk).exclude(order__status='done').update(
+                        price=Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('price')[:1])
+                    )
+                updated += Order.objects.filter(pk__in=chunk).update_totals()
+        self.stdout.write(self.style.SUCCESS('Пересчитано заказов: {}'.format(updated)))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app.models import Product
+from app.search import index_products, search_config
+
+
+class Command(BaseCommand):
+    help = (
+        'Переиндексирует полнотекстовый поиск товаров: search_vector в PostgreSQL '
+        '(с текущей PRODUCT_SEARCH_CONFIG) или таблицу FTS5 в SQLite. Нужен после '
+        'смены PRODUCT_SEARCH_CONFIG на существующей базе.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        product_ids = Product.objects.order_by('pk').values_list('pk', flat=True)
+        last_id = 0
+        indexed = 0
+        while True:
+            chunk = list(product_ids.filter(pk__gt=last_id)[:chunk_size])
+            if not chunk:
+                break
+            last_id = chunk[-1]
+            with transaction.atomic():
+                index_products(chunk)
+            indexed += len(chunk)
+        self.stdout.write(self.style.SUCCESS('Переиндексировано товаров: {} (конфигурация {})'.format(
+            indexed, search_config())))
@@ -0,0 +1,50 @@
+import signal
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from app.jobs import Worker, job_stats, requeue_stale
+from app.models import Job
+
+
+class Command(BaseCommand):
+    help = (
+        'Воркер очереди фоновых задач в БД (app.jobs). Выполняет до --concurrency '
+        'задач одновременно; SIGTERM/SIGINT - дождаться текущих задач и выйти.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Пауза при пустой очереди, секунды')
+        parser.add_argument('--once', action='store_true', help='Выполнить готовые задачи и выйти')
+        parser.add_argument('--keep-days', type=int, default=7, help='Сколько хранить выполненные задачи')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency должен быть положительным')
+        if connection.vendor == 'sqlite' and options['concurrency'] > 1:
+            # SQLite допускает одну пишущую транзакцию: параллельные задачи ловили бы "database is locked"
+            self.stderr.write('SQLite: задачи выполняются по одной')
+            options['concurrency'] = 1
+        purged, _ = Job.objects.filter(
+            status=Job.DONE, finished_at__lt=timezone.now() - timedelta(days=options['keep_days'])
+        ).delete()
+        requeued = requeue_stale()
+        self.stdout.write('Очередь: {}; удалено выполненных: {}, возвращено в очередь: {}'.format(
+            job_stats(), purged, requeued))
+
+        worker = Worker(concurrency=options['concurrency'])
+        if options['once']:
+            done = worker.run_once()
+            self.stdout.write(self.style.SUCCESS('Выполнено задач: {}'.format(done)))
+            return
+
+        def stop(signum, frame):
+            worker.stopping = True
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        self.stdout.write('Воркер {} запущен, concurrency={}'.format(worker.name, worker.concurrency))
+        worker.run(poll_interval=options['poll_interval'])
+        self.stdout.write(self.style.SUCCESS('Воркер остановлен'))
@@ -0,0 +1,135 @@
+import json
+import logging
+import re
+import sys
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.serializers import Serializer
+
+logger = logging.getLogger('app.queries')
+
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+SERIALIZER_CODE = Serializer.to_representation.__code__
+
+
+def query_shape(sql):
+    return IN_LIST_RE.sub('IN (...)', sql)
+
+
+def serializer_field_source():
+    # ближайший по стеку Serializer.to_representation и поле, которое он сейчас читает
+    frame = sys._getframe(2)
+    while frame is not None:
+        if frame.f_code is SERIALIZER_CODE:
+            field = frame.f_locals.get('field')
+            serializer = frame.f_locals.get('self')
+            if field is not None:
+                return '{}.{}'.format(type(serializer).__name__, field.field_name)
+        frame = frame.f_back
+    return None
+
+
+class QueryCounter:
+    """
+    Считает SQL-запросы и время БД во всех подключениях внутри блока with.
+    Для каждого запроса запоминается его "форма" (SQL без параметров)
+    и поле сериализатора, при чтении которого запрос был выполнен.
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'shape': query_shape(sql),
+                'duration': time.perf_counter() - start,
+                'source': serializer_field_source(),
+            })
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for alias in connections:
+            self._stack.enter_context(connections[alias].execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def db_time(self):
+        return sum(query['duration'] for query in self.queries)
+
+    def repeated(self, threshold):
+        shapes = Counter(query['shape'] for query in self.queries)
+        repeated = []
+        for shape, count in shapes.items():
+            if count < threshold:
+                continue
+            sources = {query['source'] for query in self.queries if query['shape'] == shape}
+            repeated.append({'sql': shape, 'count': count, 'source': sorted(filter(None, sources))})
+        return repeated
+
+
+def get_query_budget(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None, None, None
+    view_class = getattr(match.func, 'cls', None)
+    actions = getattr(match.func, 'actions', None) or {}
+    action = actions.get(request.method.lower())
+    budget = getattr(view_class, 'query_budget', None)
+    if isinstance(budget, dict):
+        budget = budget.get(action)
+    view_name = view_class.__name__ if view_class else None
+    return view_name, action, budget
+
+
+class QueryBudgetMiddleware:
+    """
+    Включается настройкой QUERY_BUDGET_ENABLED. Для каждого запроса пишет
+    в лог ``app.queries`` JSON-отчет: число запросов, время БД, повторяющиеся
+    формы запросов (N+1) и превышение ``query_budget`` viewset'а.
+    Отчет также доступен тестам как ``response.query_report``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'QUERY_BUDGET_ENABLED', False):
+            return self.get_response(request)
+
+        with QueryCounter() as counter:
+            response = self.get_response(request)
+
+        view_name, action, budget = get_query_budget(request)
+        threshold = getattr(settings, 'QUERY_BUDGET_REPEAT_THRESHOLD', 3)
+        report = {
+            'event': 'query_budget',
+            'method': request.method,
+            'path': request.path,
+            'view': view_name,
+            'action': action,
+            'queries': counter.count,
+            'db_time_ms': round(counter.db_time * 1000, 3),
+            'budget': budget,
+            'over_budget': budget is not None and counter.count > budget,
+            'repeated': counter.repeated(threshold),
+        }
+        response.query_report = report
+
+        level = logging.WARNING if report['over_budget'] or report['repeated'] else logging.DEBUG
+        logger.log(level, json.dumps(report, ensure_ascii=False))
+        return response
@@ -0,0 +1,42 @@
+# Generated by Django 3.1.14 on 2026-10-18 07:06
+
+from django.db import migrations, models
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_totals(apps, schema_editor):
+    Product = apps.get_model('app', 'Product')
+    ProductPosition = apps.get_model('app', 'ProductPosition')
+    Order = apps.get_model('app', 'Order')
+
+    ProductPosition.objects.update(
+        price=Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('price')[:1])
+    )
+    money = DecimalField(max_digits=15, decimal_places=2)
+    total = ProductPosition.objects.filter(order=OuterRef('pk')).values('order').annotate(
+        total=Sum(ExpressionWrapper(F('price') * F('quantity'), output_field=money))
+    ).values('total')
+    Order.objects.update(total=Coalesce(Subquery(total), Value(0), output_field=money))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0002_auto_20210630_2213'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Сумма заказа'),
+        ),
+        migrations.AddField(
+            model_name='productposition',
+            name='price',
+            field=models.DecimalField(blank=True, decimal_places=2, default=0, max_digits=15, verbose_name='Цена'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
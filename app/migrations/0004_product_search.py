@@ -0,0 +1,63 @@
+# Generated by Django 3.1.14 on 2026-10-18 07:40
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+
+class AddPostgresIndex(migrations.AddIndex):
+    """AddIndex только для PostgreSQL: в SQLite вместо GIN-индекса таблица FTS5."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        # та же конфигурация, что в app.search.search_config
+        config = getattr(settings, 'PRODUCT_SEARCH_CONFIG', 'russian')
+        schema_editor.execute(
+            "UPDATE app_product SET search_vector = "
+            "setweight(to_tsvector(%s::regconfig, COALESCE(name, '')), 'A') || "
+            "setweight(to_tsvector(%s::regconfig, COALESCE(\"desc\", '')), 'B')",
+            (config, config),
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute('CREATE VIRTUAL TABLE app_product_fts USING fts5(name, "desc")')
+        schema_editor.execute(
+            'INSERT INTO app_product_fts (rowid, name, "desc") '
+            'SELECT timestampfields_ptr_id, name, "desc" FROM app_product'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS app_product_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_order_total_position_price'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        AddPostgresIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='app_product_search_vector_gin'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
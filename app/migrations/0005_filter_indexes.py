@@ -0,0 +1,37 @@
+# Generated by Django 3.1.14 on 2026-10-18 07:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_product_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['creator', 'status'], name='order_creator_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status'], name='order_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price'], name='product_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productreview',
+            index=models.Index(fields=['review_product', 'rating'], name='review_product_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timestampfields',
+            index=models.Index(fields=['created_at'], name='timestamp_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timestampfields',
+            index=models.Index(fields=['updated_at'], name='timestamp_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 3.1.14 on 2026-10-18 07:13
+
+from django.db import migrations, models
+from django.db.models import Count, FloatField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+
+def fill_rating_aggregates(apps, schema_editor):
+    Product = apps.get_model('app', 'Product')
+    ProductReview = apps.get_model('app', 'ProductReview')
+    reviews = ProductReview.objects.filter(review_product=OuterRef('pk')).values('review_product')
+
+    def aggregate(expression):
+        return Coalesce(Subquery(reviews.annotate(value=expression).values('value')), Value(0))
+
+    values = {'rating_{}'.format(rating): aggregate(Count('pk', filter=Q(rating=rating))) for rating in range(1, 6)}
+    values['review_count'] = aggregate(Count('pk'))
+    values['rating_sum'] = aggregate(Sum('rating'))
+    values['rating_avg'] = Coalesce(
+        Cast(values['rating_sum'], FloatField()) / NullIf(values['review_count'], Value(0)), Value(0.0)
+    )
+    Product.objects.update(**values)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_1',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_2',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_3',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_4',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_5',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_avg',
+            field=models.FloatField(default=0, editable=False, verbose_name='Средняя оценка'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Сумма оценок'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество отзывов'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['rating_avg'], name='product_rating_avg_idx'),
+        ),
+        migrations.RunPython(fill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.1.14 on 2026-10-18 09:02
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_product_count(apps, schema_editor):
+    Collection = apps.get_model('app', 'Collection')
+    count = Collection.products.through.objects.filter(collection=OuterRef('pk')).values('collection').annotate(
+        count=Count('pk')
+    ).values('count')
+    Collection.objects.update(product_count=Coalesce(Subquery(count), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_product_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collection',
+            name='product_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество товаров'),
+        ),
+        migrations.RunPython(fill_product_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 3.1.14 on 2026-10-18 07:34
+
+from django.db import migrations, models
+from django.db.models import Count, FloatField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+
+def remove_duplicate_reviews(apps, schema_editor):
+    # перед уникальным индексом остается последний отзыв пользователя о товаре
+    Product = apps.get_model('app', 'Product')
+    ProductReview = apps.get_model('app', 'ProductReview')
+    latest = ProductReview.objects.filter(
+        creator=OuterRef('creator'), review_product=OuterRef('review_product')
+    ).order_by('-pk').values('pk')[:1]
+    duplicates = ProductReview.objects.exclude(pk=Subquery(latest))
+    product_ids = set(duplicates.values_list('review_product_id', flat=True))
+    if not product_ids:
+        return
+    duplicates.delete()
+
+    reviews = ProductReview.objects.filter(review_product=OuterRef('pk')).values('review_product')
+
+    def aggregate(expression):
+        return Coalesce(Subquery(reviews.annotate(value=expression).values('value')), Value(0))
+
+    values = {'rating_{}'.format(rating): aggregate(Count('pk', filter=Q(rating=rating))) for rating in range(1, 6)}
+    values['review_count'] = aggregate(Count('pk'))
+    values['rating_sum'] = aggregate(Sum('rating'))
+    values['rating_avg'] = Coalesce(
+        Cast(values['rating_sum'], FloatField()) / NullIf(values['review_count'], Value(0)), Value(0.0)
+    )
+    Product.objects.filter(pk__in=product_ids).update(**values)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_collection_product_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_reviews, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='productreview',
+            constraint=models.UniqueConstraint(fields=('creator', 'review_product'), name='review_creator_product_uniq'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 3.1.14 on 2026-10-18 07:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_review_creator_product_uniq'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HourlySales',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.DateTimeField(verbose_name='Начало периода')),
+                ('status', models.CharField(choices=[('new', 'Новый'), ('in_progress', 'В обработке'), ('done', 'Завершен')], max_length=20, verbose_name='Статус')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Выручка')),
+                ('units', models.PositiveIntegerField(default=0, verbose_name='Количество')),
+                ('orders', models.PositiveIntegerField(default=0, verbose_name='Заказов')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='app.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'hourly-sales',
+                'verbose_name_plural': 'hourly-sales',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.DateTimeField(verbose_name='Начало периода')),
+                ('status', models.CharField(choices=[('new', 'Новый'), ('in_progress', 'В обработке'), ('done', 'Завершен')], max_length=20, verbose_name='Статус')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Выручка')),
+                ('units', models.PositiveIntegerField(default=0, verbose_name='Количество')),
+                ('orders', models.PositiveIntegerField(default=0, verbose_name='Заказов')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='app.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'daily-sales',
+                'verbose_name_plural': 'daily-sales',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='hourlysales',
+            constraint=models.UniqueConstraint(fields=('period', 'product', 'status'), name='hourly_sales_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailysales',
+            constraint=models.UniqueConstraint(fields=('period', 'product', 'status'), name='daily_sales_uniq'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.1.14 on 2026-10-18 07:39
+
+from django.db import migrations, models
+
+
+def fix_default_status(apps, schema_editor):
+    # старое значение по умолчанию 1 не входит в STATUS
+    Order = apps.get_model('app', 'Order')
+    Order.objects.exclude(status__in=('new', 'in_progress', 'done')).update(status='new')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_status_idx',
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('new', 'Новый'), ('in_progress', 'В обработке'), ('done', 'Завершен')], default='new', max_length=20, verbose_name='Статус'),
+        ),
+        migrations.RunPython(fix_default_status, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(status__in=('new', 'in_progress')), fields=['status'], name='order_open_status_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-18 08:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_product_sku'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='result',
+            field=models.JSONField(blank=True, null=True, verbose_name='Прогресс и результат'),
+        ),
+    ]
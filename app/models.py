@@ -1,5 +1,10 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, FloatField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+from django.utils import timezone
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 
 
 class TimestampFields(models.Model):
@@ -12,19 +17,105 @@ class TimestampFields(models.Model):
         verbose_name="Дата обновления"
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='timestamp_created_idx'),
+            models.Index(fields=['updated_at'], name='timestamp_updated_idx'),
+        ]
+
+
+RATINGS = (1, 2, 3, 4, 5)
+
+
+def rating_avg(review_count, rating_sum):
+    return Coalesce(Cast(rating_sum, FloatField()) / NullIf(review_count, Value(0)), Value(0.0))
+
+
+class ProductQuerySet(models.QuerySet):
+
+    def apply_review(self, rating, sign=1):
+        """Инкрементально добавляет (sign=1) или вычитает (sign=-1) оценку из агрегатов."""
+        review_count = F('review_count') + sign
+        rating_sum = F('rating_sum') + sign * rating
+        updated = self.update(**{
+            'review_count': review_count,
+            'rating_sum': rating_sum,
+            'rating_{}'.format(rating): F('rating_{}'.format(rating)) + sign,
+            'rating_avg': rating_avg(review_count, rating_sum),
+        })
+        self.touch()
+        return updated
+
+    def rebuild_rating_aggregates(self):
+        reviews = ProductReview.objects.filter(review_product=OuterRef('pk')).values('review_product')
+
+        def aggregate(expression):
+            return Coalesce(Subquery(reviews.annotate(value=expression).values('value')), Value(0))
+
+        values = {'rating_{}'.format(rating): aggregate(Count('pk', filter=Q(rating=rating))) for rating in RATINGS}
+        values['review_count'] = aggregate(Count('pk'))
+        values['rating_sum'] = aggregate(Sum('rating'))
+        values['rating_avg'] = rating_avg(values['review_count'], values['rating_sum'])
+        updated = self.update(**values)
+        self.touch()
+        return updated
+
+    def sync_open_positions(self):
+        """
+        Переносит текущие цены товаров в позиции незавершенных заказов и
+        пересчитывает их суммы. Возвращает id измененных заказов.
+        """
+        price = Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('price')[:1])
+        positions = ProductPosition.objects.filter(product__in=self.values('pk')).exclude(order__status='done')
+        order_ids = list(positions.exclude(price=price).values_list('order_id', flat=True).distinct())
+        if order_ids:
+            positions.filter(order_id__in=order_ids).update(price=price)
+            Order.objects.filter(pk__in=order_ids).update_totals()
+        return order_ids
+
+    def touch(self):
+        """
+        Обновляет updated_at: update() его не меняет, а по нему снимки
+        каталога в других процессах догружают изменения (app.catalogue).
+        """
+        return TimestampFields.objects.filter(pk__in=self.values('pk')).update(updated_at=timezone.now())
+
 
 class Product(TimestampFields):
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True, verbose_name="Артикул")
     name = models.CharField(max_length=50, verbose_name="Название")
     desc = models.TextField(max_length=200, verbose_name="Описание")
     price = models.DecimalField(max_digits=15, verbose_name="Цена", decimal_places=2)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    review_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Количество отзывов")
+    rating_sum = models.PositiveIntegerField(default=0, editable=False, verbose_name="Сумма оценок")
+    rating_avg = models.FloatField(default=0, editable=False, verbose_name="Средняя оценка")
+    rating_1 = models.PositiveIntegerField(default=0, editable=False)
+    rating_2 = models.PositiveIntegerField(default=0, editable=False)
+    rating_3 = models.PositiveIntegerField(default=0, editable=False)
+    rating_4 = models.PositiveIntegerField(default=0, editable=False)
+    rating_5 = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = ProductQuerySet.as_manager()
 
     class Meta:
         verbose_name_plural = 'products'
         verbose_name = 'product'
+        indexes = [
+            models.Index(fields=['price'], name='product_price_idx'),
+            models.Index(fields=['rating_avg'], name='product_rating_avg_idx'),
+            # создается только в PostgreSQL (см. миграцию 0004)
+            GinIndex(fields=['search_vector'], name='app_product_search_vector_gin'),
+        ]
 
     def __str__(self):
         return self.name
 
+    @property
+    def rating_histogram(self):
+        return {rating: getattr(self, 'rating_{}'.format(rating)) for rating in RATINGS}
+
 
 class ProductReview(TimestampFields):
     review_product = models.ForeignKey(
@@ -52,15 +143,70 @@ class ProductReview(TimestampFields):
     class Meta:
         verbose_name_plural = 'product-reviews'
         verbose_name = 'product-reviews'
+        indexes = [
+            models.Index(fields=['review_product', 'rating'], name='review_product_rating_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['creator', 'review_product'], name='review_creator_product_uniq'),
+        ]
 
 
 class ProductPosition(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name="Товары")
     order = models.ForeignKey("Order", related_name='positions', on_delete=models.CASCADE, verbose_name="Заказ")
     quantity = models.PositiveIntegerField(default=1, verbose_name="Количество")
+    price = models.DecimalField(max_digits=15, decimal_places=2, blank=True, verbose_name="Цена")
+
+    def save(self, *args, **kwargs):
+        if self.price is None:
+            self.price = Product.objects.values_list('price', flat=True).get(pk=self.product_id)
+        super().save(*args, **kwargs)
 
     def get_cost(self):
-        return self.product.price * self.quantity
+        return self.price * self.quantity
+
+
+def position_cost():
+    return ExpressionWrapper(F('price') * F('quantity'), output_field=DecimalField(max_digits=15, decimal_places=2))
+
+
+class OrderQuerySet(models.QuerySet):
+
+    def update_totals(self):
+        total = ProductPosition.objects.filter(order=OuterRef('pk')).values('order').annotate(
+            total=Sum(position_cost())
+        ).values('total')
+        return self.update(total=Coalesce(Subquery(total), Value(0), output_field=DecimalField(max_digits=15, decimal_places=2)))
+
+    def open(self):
+        return self.filter(status__in=Order.OPEN_STATUSES)
+
+    def transition(self, pks, status):
+        """
+        Переводит заказы в ``status`` из статуса ``Order.TRANSITIONS[status]``
+        одним UPDATE ... WHERE id IN (...) AND status = ... и возвращает
+        {id: (результат, статус после)}. Результаты: updated, unchanged,
+        invalid_transition, not_found.
+        """
+        source = Order.TRANSITIONS[status]
+        with transaction.atomic():
+            current = dict(self.filter(pk__in=pks).order_by().select_for_update().values_list('pk', 'status'))
+            updated = [pk for pk, value in current.items() if value == source]
+            if updated:
+                self.filter(pk__in=updated, status=source).update(status=status)
+                TimestampFields.objects.filter(pk__in=updated).update(updated_at=timezone.now())
+
+        results = {}
+        for pk in pks:
+            if pk not in current:
+                results[pk] = ('not_found', None)
+            elif current[pk] == source:
+                results[pk] = ('updated', status)
+            elif current[pk] == status:
+                results[pk] = ('unchanged', status)
+            else:
+                results[pk] = ('invalid_transition', current[pk])
+        return results
 
 
 class Order(TimestampFields):
@@ -77,24 +223,51 @@ class Order(TimestampFields):
         ('done', 'Завершен')
     )
 
-    status = models.CharField(choices=STATUS, max_length=20, default=1, verbose_name="Статус")
+    OPEN_STATUSES = ('new', 'in_progress')
+    # допустимые переходы: новый статус - из какого
+    TRANSITIONS = {'in_progress': 'new', 'done': 'in_progress'}
+
+    status = models.CharField(choices=STATUS, max_length=20, default='new', verbose_name="Статус")
     products = models.ManyToManyField(Product, through=ProductPosition, verbose_name="Товары")
+    total = models.DecimalField(max_digits=15, decimal_places=2, default=0, verbose_name="Сумма заказа")
+
+    objects = OrderQuerySet.as_manager()
 
     def get_total_cost(self):
-        return sum(item.get_cost() for item in self.positions.all())
+        total = self.positions.aggregate(total=Sum(position_cost()))['total']
+        return total or 0
 
-    order_sum = property(get_total_cost)
+    @property
+    def order_sum(self):
+        return self.total
 
     class Meta:
         verbose_name_plural = 'orders'
         verbose_name = 'order'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['creator', 'status'], name='order_creator_status_idx'),
+            # завершенных заказов большинство, и индекс по ним бесполезен: только открытые
+            models.Index(fields=['status'], name='order_open_status_idx', condition=Q(status__in=('new', 'in_progress'))),
+        ]
+
+
+class CollectionQuerySet(models.QuerySet):
+
+    def update_product_counts(self):
+        count = Collection.products.through.objects.filter(collection=OuterRef('pk')).values('collection').annotate(
+            count=Count('pk')
+        ).values('count')
+        return self.update(product_count=Coalesce(Subquery(count), Value(0)))
 
 
 class Collection(TimestampFields):
     title = models.CharField(max_length=50,  verbose_name="Заголовок")
     text = models.TextField(verbose_name="Описание")
     products = models.ManyToManyField(Product, verbose_name="Товары")
+    product_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Количество товаров")
+
+    objects = CollectionQuerySet.as_manager()
 
     class Meta:
         verbose_name_plural = 'collections'
@@ -102,3 +275,75 @@ class Collection(TimestampFields):
 
     def __str__(self):
         return self.title
+
+
+class SalesRollup(models.Model):
+    """Продажи товара за период по статусу заказа; ведется app.reports, а не вручную."""
+    period = models.DateTimeField(verbose_name="Начало периода")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+', verbose_name="Товар")
+    status = models.CharField(choices=Order.STATUS, max_length=20, verbose_name="Статус")
+    revenue = models.DecimalField(max_digits=15, decimal_places=2, default=0, verbose_name="Выручка")
+    units = models.PositiveIntegerField(default=0, verbose_name="Количество")
+    orders = models.PositiveIntegerField(default=0, verbose_name="Заказов")
+
+    class Meta:
+        abstract = True
+
+
+class DailySales(SalesRollup):
+
+    class Meta:
+        verbose_name_plural = 'daily-sales'
+        verbose_name = 'daily-sales'
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'product', 'status'], name='daily_sales_uniq'),
+        ]
+
+
+class HourlySales(SalesRollup):
+
+    class Meta:
+        verbose_name_plural = 'hourly-sales'
+        verbose_name = 'hourly-sales'
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'product', 'status'], name='hourly_sales_uniq'),
+        ]
+
+
+class Job(models.Model):
+    """Фоновая задача из очереди app.jobs; выполняется командой run_jobs."""
+    QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+    STATUS = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    )
+
+    name = models.CharField(max_length=100, verbose_name="Задача")
+    payload = models.JSONField(default=dict, verbose_name="Аргументы")
+    key = models.CharField(max_length=200, null=True, blank=True, verbose_name="Ключ дедупликации")
+    status = models.CharField(choices=STATUS, max_length=20, default=QUEUED, verbose_name="Статус")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Попыток")
+    max_attempts = models.PositiveIntegerField(default=3, verbose_name="Максимум попыток")
+    run_at = models.DateTimeField(default=timezone.now, verbose_name="Запустить не раньше")
+    locked_by = models.CharField(max_length=64, null=True, blank=True, verbose_name="Воркер")
+    locked_at = models.DateTimeField(null=True, blank=True, verbose_name="Взята в работу")
+    last_error = models.TextField(blank=True, verbose_name="Последняя ошибка")
+    result = models.JSONField(null=True, blank=True, verbose_name="Прогресс и результат")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Завершена")
+
+    class Meta:
+        verbose_name_plural = 'jobs'
+        verbose_name = 'job'
+        indexes = [
+            models.Index(fields=['run_at'], name='job_queued_run_at_idx', condition=Q(status='queued')),
+        ]
+        constraints = [
+            # одинаковая задача в очереди одна; выполняемая не мешает поставить новую
+            models.UniqueConstraint(fields=['key'], name='job_queued_key_uniq', condition=Q(status='queued')),
+        ]
+
+    def __str__(self):
+        return '{} #{}'.format(self.name, self.pk)
@@ -0,0 +1,89 @@
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Keyset pagination по (created_at, id): следующая страница выбирается
+    условием WHERE created_at > <cursor>, а не OFFSET, поэтому стоимость
+    запроса не зависит от глубины.
+
+    Размер страницы и порядок задаются во viewset атрибутами ``page_size``
+    и ``ordering`` (или методом ``get_ordering()``). Клиент может уменьшить
+    страницу параметром ``page_size``.
+
+    Режим совместимости: при ``PAGINATION_LIST_COMPAT = True`` в settings
+    тело ответа остается простым списком, как до введения пагинации,
+    а ссылки на соседние страницы передаются в заголовке ``Link``
+    (rel="next" / rel="prev").
+    """
+    ordering = ('created_at', 'pk')
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = getattr(view, 'page_size', None) or self.page_size
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_ordering(self, request, queryset, view):
+        if hasattr(view, 'get_ordering'):
+            self.ordering = view.get_ordering() or self.ordering
+        else:
+            self.ordering = getattr(view, 'ordering', None) or self.ordering
+        return super().get_ordering(request, queryset, view)
+
+    def get_paginated_response(self, data):
+        if not getattr(settings, 'PAGINATION_LIST_COMPAT', False):
+            return super().get_paginated_response(data)
+
+        links = []
+        next_link = self.get_next_link()
+        previous_link = self.get_previous_link()
+        if next_link:
+            links.append('<{}>; rel="next"'.format(next_link))
+        if previous_link:
+            links.append('<{}>; rel="prev"'.format(previous_link))
+        headers = {'Link': ', '.join(links)} if links else None
+        return Response(data, headers=headers)
+
+
+class MembershipPagination(KeysetPagination):
+    """Постраничный обход строк промежуточной таблицы M2M по id связанного объекта."""
+    page_size = 100
+    ordering = ('product_id',)
+
+    def get_ordering(self, request, queryset, view):
+        return self.ordering
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор админки: для списка без фильтров на PostgreSQL число строк
+    берется из статистики планировщика (pg_class.reltuples), а не из
+    COUNT(*) по всей таблице. Точный COUNT(*) - для отфильтрованных списков,
+    других СУБД и таблиц меньше ``exact_below`` строк.
+    """
+    exact_below = 10000
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where and not query.distinct:
+            estimate = self.estimate(self.object_list)
+            if estimate is not None and estimate >= self.exact_below:
+                return estimate
+        return super().count
+
+    def estimate(self, queryset):
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                           [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        return row[0] if row and row[0] > 0 else None
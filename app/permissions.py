@@ -5,4 +5,41 @@ class AllowOnly(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         if request.method in permissions.SAFE_METHODS:
             return True
-        return obj.creator == request.user
+        # сравниваем id, не загружая пользователя-владельца
+        return obj.creator_id == request.user.pk
+
+
+class ActionPermissionsMixin:
+    """
+    Права по действиям viewset'а из ``permission_classes_by_action``.
+
+    Экземпляры permission-классов создаются один раз при объявлении класса,
+    ``partial_update`` наследует права ``update``. Для действий без записи
+    используются ``permission_classes``.
+
+    Если задан ``owner_field``, queryset для не-админов ограничивается
+    в SQL объектами текущего пользователя.
+    """
+    permission_classes_by_action = {}
+    owner_field = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        by_action = dict(cls.permission_classes_by_action)
+        if 'update' in by_action:
+            by_action.setdefault('partial_update', by_action['update'])
+        cls._permissions_by_action = {
+            action: tuple(permission() for permission in classes)
+            for action, classes in by_action.items()
+        }
+        cls._default_permissions = tuple(permission() for permission in cls.permission_classes)
+
+    def get_permissions(self):
+        return self._permissions_by_action.get(self.action, self._default_permissions)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if self.owner_field and not user.is_staff:
+            queryset = queryset.filter(**{'{}_id'.format(self.owner_field): user.pk})
+        return queryset
@@ -0,0 +1,251 @@
+import os
+import threading
+import time
+from collections import deque
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import OperationalError
+
+POOL_DEFAULTS = {
+    'MIN_SIZE': 2,
+    'MAX_SIZE': 10,
+    # сколько ждать свободного соединения, прежде чем вернуть ошибку
+    'TIMEOUT': 10,
+    # соединения, простаивающие дольше, закрываются (но не меньше MIN_SIZE)
+    'MAX_IDLE': 300,
+    # соединение переоткрывается после MAX_LIFETIME секунд жизни
+    'MAX_LIFETIME': 3600,
+    # простаивавшее дольше соединение проверяется перед выдачей
+    'CHECK_INTERVAL': 30,
+}
+
+_pools = {}
+_pools_lock = threading.Lock()
+_pools_pid = None
+
+
+class PoolTimeout(OperationalError):
+    pass
+
+
+class PooledConnection:
+    __slots__ = ('connection', 'created_at', 'released_at')
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.created_at = self.released_at = time.monotonic()
+
+
+class ConnectionPool:
+    """
+    Пул соединений одного процесса. ``connect`` открывает новое соединение,
+    ``check`` проверяет соединение перед выдачей, ``reset`` готовит его
+    к возврату в пул; если ``check`` или ``reset`` вернули False или
+    упали, соединение закрывается через ``close``.
+    """
+
+    def __init__(self, connect, check, reset, close, min_size, max_size, timeout,
+                 max_idle, max_lifetime, check_interval):
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ImproperlyConfigured('POOL: нужно 0 <= MIN_SIZE <= MAX_SIZE и MAX_SIZE >= 1')
+        self.connect, self.check, self.reset, self.close = connect, check, reset, close
+        self.min_size, self.max_size, self.timeout = min_size, max_size, timeout
+        self.max_idle, self.max_lifetime, self.check_interval = max_idle, max_lifetime, check_interval
+
+        self._idle = deque()
+        self._in_use = {}
+        self._size = 0
+        self._waiting = 0
+        self._lock = threading.Condition()
+        self.metrics = dict.fromkeys((
+            'acquired', 'created', 'closed', 'recycled', 'health_check_failures',
+            'waits', 'timeouts', 'wait_time_total', 'wait_time_max',
+        ), 0)
+
+    def acquire(self):
+        started = None
+        with self._lock:
+            while True:
+                item = self._pop_idle()
+                if item is not None:
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                if started is None:
+                    started = time.monotonic()
+                    self.metrics['waits'] += 1
+                remaining = self.timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self.metrics['timeouts'] += 1
+                    self._record_wait(started)
+                    raise PoolTimeout('Нет свободных соединений в пуле за {} c (MAX_SIZE={})'.format(
+                        self.timeout, self.max_size))
+                self._waiting += 1
+                try:
+                    self._lock.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            if started is not None:
+                self._record_wait(started)
+
+        if item is not None and not self._usable(item):
+            self._discard(item, 'health_check_failures')
+            return self.acquire()
+
+        if item is None:
+            try:
+                item = PooledConnection(self.connect())
+            except BaseException:
+                with self._lock:
+                    self._size -= 1
+                    self._lock.notify()
+                raise
+            with self._lock:
+                self.metrics['created'] += 1
+
+        with self._lock:
+            self._in_use[id(item.connection)] = item
+            self.metrics['acquired'] += 1
+        return item.connection
+
+    def release(self, connection):
+        with self._lock:
+            item = self._in_use.pop(id(connection), None)
+        if item is None:
+            self.close(connection)
+            return
+
+        now = time.monotonic()
+        try:
+            reusable = now - item.created_at < self.max_lifetime and self.reset(connection)
+        except Exception:
+            reusable = False
+        if not reusable:
+            self._discard(item, 'recycled')
+            return
+
+        item.released_at = now
+        with self._lock:
+            self._idle.append(item)
+            self._lock.notify()
+        self._trim()
+
+    def warm(self):
+        """Открывает соединения до MIN_SIZE."""
+        while True:
+            with self._lock:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                item = PooledConnection(self.connect())
+            except BaseException:
+                with self._lock:
+                    self._size -= 1
+                raise
+            with self._lock:
+                self.metrics['created'] += 1
+                self._idle.append(item)
+                self._lock.notify()
+
+    def close_all(self):
+        with self._lock:
+            items, self._idle = list(self._idle), deque()
+        for item in items:
+            self._discard(item, 'closed')
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.metrics)
+            stats.update(size=self._size, idle=len(self._idle), in_use=len(self._in_use),
+                         waiting=self._waiting, min_size=self.min_size, max_size=self.max_size)
+        stats['wait_time_total'] = round(stats['wait_time_total'], 6)
+        stats['wait_time_max'] = round(stats['wait_time_max'], 6)
+        return stats
+
+    def _pop_idle(self):
+        # LIFO: свежие соединения переиспользуются, старые в хвосте простаивают и закрываются
+        return self._idle.pop() if self._idle else None
+
+    def _usable(self, item):
+        now = time.monotonic()
+        if now - item.created_at >= self.max_lifetime:
+            return False
+        if now - item.released_at < self.check_interval:
+            return True
+        try:
+            return self.check(item.connection)
+        except Exception:
+            return False
+
+    def _trim(self):
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            while (self._idle and self._size - len(expired) > self.min_size
+                   and now - self._idle[0].released_at >= self.max_idle):
+                expired.append(self._idle.popleft())
+        for item in expired:
+            self._discard(item, 'recycled')
+
+    def _discard(self, item, reason):
+        try:
+            self.close(item.connection)
+        except Exception:
+            pass
+        with self._lock:
+            self._size -= 1
+            self.metrics[reason] += 1
+            self._lock.notify()
+
+    def _record_wait(self, started):
+        waited = time.monotonic() - started
+        self.metrics['wait_time_total'] += waited
+        self.metrics['wait_time_max'] = max(self.metrics['wait_time_max'], waited)
+
+
+def get_pool(key, options, **callbacks):
+    """
+    Пул для ключа (alias + параметры подключения). Пулы не переживают fork:
+    при первом обращении в новом процессе (gunicorn --preload) они создаются заново.
+    """
+    global _pools_pid
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            _pools.clear()
+            _pools_pid = os.getpid()
+        pool = _pools.get(key)
+        if pool is None:
+            config = dict(POOL_DEFAULTS, **(options or {}))
+            pool = _pools[key] = ConnectionPool(
+                min_size=config['MIN_SIZE'], max_size=config['MAX_SIZE'], timeout=config['TIMEOUT'],
+                max_idle=config['MAX_IDLE'], max_lifetime=config['MAX_LIFETIME'],
+                check_interval=config['CHECK_INTERVAL'], **callbacks
+            )
+            created = True
+        else:
+            created = False
+    if created:
+        pool.warm()
+    return pool
+
+
+def pool_stats():
+    """Метрики пулов текущего процесса по alias базы."""
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            return {}
+        pools = list(_pools.items())
+    stats = {}
+    for (alias, _), pool in pools:
+        stats.setdefault(alias, []).append(pool.stats())
+    return stats
+
+
+def close_pools(alias):
+    """Закрывает простаивающие соединения alias (например, перед DROP/клонированием тестовой БД)."""
+    with _pools_lock:
+        pools = [pool for (pool_alias, _), pool in _pools.items() if pool_alias == alias]
+    for pool in pools:
+        pool.close_all()
@@ -0,0 +1,119 @@
+import threading
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .jobs import create_job, task
+from .models import DailySales, HourlySales, Order, ProductPosition, position_cost
+
+# модель сводки, функция усечения в БД и длина периода
+GRAINS = {
+    'day': (DailySales, TruncDay, timedelta(days=1)),
+    'hour': (HourlySales, TruncHour, timedelta(hours=1)),
+}
+
+
+def period_start(moment, grain):
+    """Начало периода в текущей часовой зоне, как у TruncDay/TruncHour."""
+    moment = timezone.localtime(moment).replace(tzinfo=None, minute=0, second=0, microsecond=0)
+    if grain == 'day':
+        moment = moment.replace(hour=0)
+    return timezone.make_aware(moment)
+
+
+def sales_rows(positions, *group):
+    """Строки сводки из позиций: выручка, штуки и число заказов по товару и статусу."""
+    group += ('product_id', 'order__status')
+    return positions.values(*group).annotate(
+        revenue=Sum(position_cost()), units=Sum('quantity'), orders=Count('order_id', distinct=True),
+    ).values_list(*group, 'revenue', 'units', 'orders')
+
+
+def create_rollups(model, rows):
+    model.objects.bulk_create([
+        model(period=period, product_id=product_id, status=status, revenue=revenue, units=units, orders=orders)
+        for period, product_id, status, revenue, units, orders in rows
+    ])
+
+
+def refresh_sales(pairs):
+    """
+    Пересчитывает из позиций строки сводок для пар (created_at заказа, id
+    товара): по одному DELETE и одному агрегирующему запросу на каждый
+    затронутый период. Читаются только позиции этих товаров за этот период.
+    """
+    for grain, (model, _, length) in GRAINS.items():
+        periods = {}
+        for created_at, product_id in pairs:
+            periods.setdefault(period_start(created_at, grain), set()).add(product_id)
+        for start, product_ids in sorted(periods.items()):
+            positions = ProductPosition.objects.filter(
+                order__created_at__gte=start, order__created_at__lt=start + length, product_id__in=product_ids,
+            )
+            rows = [(start,) + row for row in sales_rows(positions)]
+            model.objects.filter(period=start, product_id__in=product_ids).delete()
+            create_rollups(model, rows)
+
+
+def rebuild_sales(start, end):
+    """Полный пересчет сводок за [start, end) одним агрегирующим запросом на зерно."""
+    positions = ProductPosition.objects.filter(order__created_at__gte=start, order__created_at__lt=end)
+    for model, trunc, _ in GRAINS.values():
+        rows = list(sales_rows(positions.annotate(period=trunc('order__created_at')), 'period'))
+        model.objects.filter(period__gte=start, period__lt=end).delete()
+        create_rollups(model, rows)
+
+
+@task('sales.refresh')
+def refresh_product_hour(period, product_id):
+    """Строки сводок товара за час ``period`` и за его день."""
+    with transaction.atomic():
+        refresh_sales([(parse_datetime(period), product_id)])
+
+
+class PendingSales(threading.local):
+    """Изменения текущего потока, еще не перенесенные в сводки."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.order_ids = set()
+        self.positions = set()
+        self.created = {}
+
+
+pending = PendingSales()
+
+
+def mark_sales(order_ids=(), positions=(), created=None):
+    """
+    Отмечает измененные заказы (все их позиции) и пары (id заказа, id
+    товара) удаленных позиций. ``created`` - id: created_at удаляемых
+    заказов, которых после коммита уже не будет в БД. После коммита на
+    каждую пару (час, товар) ставится задача пересчета только ее строк.
+    """
+    pending.order_ids.update(order_ids)
+    pending.positions.update(positions)
+    pending.created.update(created or {})
+    transaction.on_commit(flush_sales)
+
+
+def flush_sales():
+    if not (pending.order_ids or pending.positions):
+        return
+    order_ids, positions, created = pending.order_ids, pending.positions, pending.created
+    pending.reset()
+
+    pairs = set(ProductPosition.objects.filter(order_id__in=order_ids).values_list('order__created_at', 'product_id'))
+    missing = {order_id for order_id, _ in positions} - set(created)
+    created.update(Order.objects.filter(pk__in=missing).values_list('pk', 'created_at'))
+    pairs.update((created[order_id], product_id) for order_id, product_id in positions if order_id in created)
+    # пока задача пары ждет в очереди, новые изменения этого товара за этот час к ней и сводятся
+    for hour, product_id in sorted({(period_start(moment, 'hour'), product_id) for moment, product_id in pairs}):
+        create_job('sales.refresh', key='sales:{}:{}'.format(hour.isoformat(), product_id),
+                   period=hour.isoformat(), product_id=product_id)
@@ -0,0 +1,146 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+# По умолчанию (команды, shell, фоновые задачи) все читается с основной БД.
+# ReplicaRoutingMiddleware разрешает реплики только на время безопасного запроса:
+# значение - состояние этого запроса, запись переключает его на основную БД.
+use_replica = ContextVar('use_replica', default=None)
+
+PIN_COOKIE = 'db_pin'
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def sticky_seconds():
+    return getattr(settings, 'REPLICA_STICKY_SECONDS', 10)
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    state = {'enabled': enabled}
+    token = use_replica.set(state)
+    try:
+        yield state
+    finally:
+        use_replica.reset(token)
+
+
+def replicas_allowed():
+    state = use_replica.get()
+    return state is not None and state['enabled']
+
+
+class ReplicaRouter:
+    """
+    Чтение - со случайной реплики из ``DATABASE_REPLICAS``, если это
+    разрешено для текущего запроса, запись - всегда в ``default``.
+    После первой записи чтение до конца запроса тоже идет в ``default``.
+
+    Локально реплику можно эмулировать вторым alias на тот же SQLite-файл:
+
+        DATABASES['replica'] = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
+        DATABASE_REPLICAS = ['replica']
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = get_replicas()
+        if replicas and replicas_allowed():
+            return random.choice(replicas)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # состояние меняется на месте: вне replica_reads переключать нечего,
+        # а сама переменная восстанавливается при выходе из replica_reads
+        state = use_replica.get()
+        if state is not None:
+            state['enabled'] = False
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in get_replicas():
+            return False
+        return None
+
+
+def pin_cache_key(user):
+    return 'db_pin:user:{}'.format(user.pk)
+
+
+def is_pinned(request):
+    now = time.time()
+    try:
+        if float(request.COOKIES.get(PIN_COOKIE, 0)) > now:
+            return True
+    except ValueError:
+        pass
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return cache.get(pin_cache_key(user), 0) > now
+    return False
+
+
+def pin_to_primary(request, response):
+    until = time.time() + sticky_seconds()
+    response.set_cookie(PIN_COOKIE, str(until), max_age=sticky_seconds(), httponly=True, samesite='Lax')
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        cache.set(pin_cache_key(user), until, sticky_seconds())
+
+
+class ReplicaRoutingMiddleware:
+    """
+    GET/HEAD/OPTIONS читают с реплик, если клиент не писал в последние
+    ``REPLICA_STICKY_SECONDS`` секунд. После успешного небезопасного запроса
+    клиент закрепляется за основной БД (read-your-writes): cookie ``db_pin``
+    и, для авторизованных пользователей, отметка в кэше по id пользователя.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not get_replicas():
+            return self.get_response(request)
+
+        safe = request.method in ('GET', 'HEAD', 'OPTIONS')
+        with replica_reads(safe and not is_pinned(request)):
+            response = self.get_response(request)
+
+        if not safe and response.status_code < 400:
+            pin_to_primary(request, response)
+        return response
+
+    async def __acall__(self, request):
+        if not get_replicas():
+            return await self.get_response(request)
+
+        safe = request.method in ('GET', 'HEAD', 'OPTIONS')
+        # request.user и кэш синхронные
+        pinned = safe and await sync_to_async(is_pinned)(request)
+        with replica_reads(safe and not pinned):
+            response = await self.get_response(request)
+
+        if not safe and response.status_code < 400:
+            await sync_to_async(pin_to_primary)(request, response)
+        return response
@@ -0,0 +1,99 @@
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import F, FloatField
+from django.db.models.expressions import RawSQL
+
+from .models import Product
+
+FTS_TABLE = 'app_product_fts'
+
+
+def search_config():
+    return getattr(settings, 'PRODUCT_SEARCH_CONFIG', 'russian')
+
+
+def product_search_vector():
+    config = search_config()
+    return SearchVector('name', weight='A', config=config) + SearchVector('desc', weight='B', config=config)
+
+
+def fts5_query(value):
+    # каждое слово - отдельная фраза с поиском по префиксу, слова объединяются через AND
+    terms = ['"{}"*'.format(term.replace('"', '""')) for term in value.split()]
+    return ' '.join(terms)
+
+
+def search_products(queryset, value):
+    """
+    Ранжированный поиск товаров по name и desc. Добавляет аннотацию
+    ``search_rank`` (чем больше, тем релевантнее).
+
+    PostgreSQL: tsvector-колонка ``search_vector`` с GIN-индексом.
+    SQLite: виртуальная таблица FTS5 ``app_product_fts`` (rowid = id товара).
+    """
+    if not value.split():
+        return queryset
+
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(value, config=search_config(), search_type='websearch')
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        )
+
+    if connection.vendor == 'sqlite':
+        match = fts5_query(value)
+        pk_column = '{}.{}'.format(
+            connection.ops.quote_name(Product._meta.db_table),
+            connection.ops.quote_name(Product._meta.pk.column),
+        )
+        return queryset.filter(
+            pk__in=RawSQL('SELECT rowid FROM {0} WHERE {0} MATCH %s'.format(FTS_TABLE), (match,))
+        ).annotate(search_rank=RawSQL(
+            'SELECT -bm25({0}, 10.0, 1.0) FROM {0} WHERE {0} MATCH %s AND rowid = {1}'.format(FTS_TABLE, pk_column),
+            (match,),
+            output_field=FloatField(),
+        ))
+
+    return queryset.filter(name__icontains=value).annotate(search_rank=RawSQL('1.0', (), output_field=FloatField()))
+
+
+def index_product(product):
+    if connection.vendor == 'postgresql':
+        Product.objects.filter(pk=product.pk).update(search_vector=product_search_vector())
+    elif connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM {} WHERE rowid = %s'.format(FTS_TABLE), [product.pk])
+            cursor.execute(
+                'INSERT INTO {} (rowid, name, "desc") VALUES (%s, %s, %s)'.format(FTS_TABLE),
+                [product.pk, product.name, product.desc],
+            )
+
+
+def unindex_product(product):
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM {} WHERE rowid = %s'.format(FTS_TABLE), [product.pk])
+
+
+def index_products(pks):
+    """Индексирует пачку товаров без загрузки объектов: один UPDATE или DELETE + INSERT ... SELECT."""
+    pks = list(pks)
+    if not pks:
+        return
+    if connection.vendor == 'postgresql':
+        Product.objects.filter(pk__in=pks).update(search_vector=product_search_vector())
+    elif connection.vendor == 'sqlite':
+        # пачками: в старых сборках SQLite не больше 999 параметров в запросе
+        with connection.cursor() as cursor:
+            for start in range(0, len(pks), 500):
+                batch = pks[start:start + 500]
+                placeholders = ', '.join(['%s'] * len(batch))
+                cursor.execute('DELETE FROM {} WHERE rowid IN ({})'.format(FTS_TABLE, placeholders), batch)
+                cursor.execute(
+                    'INSERT INTO {} (rowid, name, "desc") SELECT {}, name, "desc" FROM {} WHERE {} IN ({})'.format(
+                        FTS_TABLE, Product._meta.pk.column, Product._meta.db_table, Product._meta.pk.column,
+                        placeholders,
+                    ),
+                    batch,
+                )
@@ -1,74 +1,274 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
-from .models import Product, ProductReview, Order, Collection
+from .catalogue import catalogue, is_enabled as catalogue_enabled
+from .reports import mark_sales
+from .signals import positions_replaced
+from .models import RATINGS, DailySales, Product, ProductPosition, ProductReview, Order, Collection
+from .sparse import SparseFieldsMixin, expanded_fields
+
+
+class ProductSummarySerializer(serializers.Serializer):
+    id = serializers.IntegerField(read_only=True)
+    name = serializers.CharField(read_only=True)
+    price = serializers.DecimalField(max_digits=15, decimal_places=2, read_only=True)
+
+
+class UserSummarySerializer(serializers.Serializer):
+    id = serializers.IntegerField(read_only=True)
+    username = serializers.CharField(read_only=True)
+
 
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    rating_histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
+
+    sparse_columns = {'rating_histogram': tuple('rating_{}'.format(rating) for rating in RATINGS)}
+    fast_values = {'rating_histogram': lambda row: {rating: row['rating_{}'.format(rating)] for rating in RATINGS}}
 
-class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
-        fields = '__all__'
+        exclude = ('search_vector', 'rating_sum', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5')
 
 
 class ProductPositionSerializer(serializers.Serializer):
 
-    product_id = serializers.PrimaryKeyRelatedField(
-        queryset=Product.objects.all(),
-        source="product.id"
-    )
+    product_id = serializers.IntegerField()
 
-    name = serializers.CharField(source='product.name', read_only=True)
+    name = serializers.SerializerMethodField()
     quantity = serializers.IntegerField(min_value=1)
-    price = serializers.DecimalField(max_digits=10, decimal_places=2, source='product.price', read_only=True, min_value=1)
+    price = serializers.DecimalField(max_digits=15, decimal_places=2, read_only=True)
+
+    def get_name(self, position):
+        # название берется из снимка каталога, без запроса товара на каждую позицию
+        if not catalogue_enabled():
+            return position.product.name
+        record = catalogue.get(position.product_id)
+        return record.name if record is not None else None
+
+
+def load_prices(orders_items):
+    """
+    Цены товаров корзин одним запросом к БД. Вызывается внутри транзакции
+    записи: снимок каталога в другом процессе может отставать от цены.
+    """
+    ids = {item['product_id'] for items in orders_items for item in items}
+    prices = dict(Product.objects.filter(pk__in=ids).values_list('pk', 'price'))
+    unknown = sorted(ids - set(prices))
+    if unknown:
+        raise ValidationError({'positions': ['Товары не найдены: {}'.format(', '.join(map(str, unknown)))]})
+    return prices
 
 
-class OrderSerializer(serializers.ModelSerializer):
+def create_positions(orders_positions, prices):
+    positions = []
+    for order, items in orders_positions:
+        order_positions = [
+            ProductPosition(
+                order=order,
+                product_id=item['product_id'],
+                price=prices[item['product_id']],
+                quantity=item['quantity'],
+            )
+            for item in items
+        ]
+        order._prefetched_objects_cache = {'positions': order_positions}
+        positions.extend(order_positions)
+    ProductPosition.objects.bulk_create(positions)
+
+
+def positions_total(items, prices):
+    return sum((prices[item['product_id']] * item['quantity'] for item in items), Decimal(0))
+
+
+class OrderListSerializer(serializers.ListSerializer):
+
+    @transaction.atomic
+    def create(self, validated_data):
+        prices = load_prices([attrs['positions'] for attrs in validated_data])
+        orders = []
+        for attrs in validated_data:
+            items = attrs.pop('positions')
+            attrs.setdefault('status', 'new')
+            order = Order.objects.create(
+                creator=self.context['request'].user,
+                total=positions_total(items, prices),
+                **attrs
+            )
+            orders.append((order, items))
+        create_positions(orders, prices)
+        return [order for order, items in orders]
+
+
+class OrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     positions = ProductPositionSerializer(many=True)
     creator = serializers.CharField(source='creator.username', read_only=True)
+    products = serializers.SerializerMethodField()
+
+    expandable_fields = {'creator': (UserSummarySerializer, 'creator')}
+    sparse_prefetch = {'products': 'positions'}
 
     class Meta:
         model = Order
         fields = '__all__'
+        read_only_fields = ('total',)
+        list_serializer_class = OrderListSerializer
+
+    def get_products(self, obj):
+        # id товаров берем из уже загруженных позиций, без отдельного запроса к M2M
+        return [position.product_id for position in obj.positions.all()]
+
+    def validate_positions(self, positions):
+        if not positions:
+            raise ValidationError('Ваша корзина пуста')
+        return positions
 
+    def validate_status(self, value):
+        # статус меняется только по Order.TRANSITIONS, как и в bulk_status
+        if self.instance is None:
+            if value != 'new':
+                raise ValidationError('Новый заказ создается в статусе new')
+        elif value != self.instance.status and Order.TRANSITIONS.get(value) != self.instance.status:
+            raise ValidationError('Недопустимый переход статуса: {} -> {}'.format(self.instance.status, value))
+        return value
+
+    @transaction.atomic
     def create(self, validated_data):
-        validated_data["creator"] = self.context["request"].user
-        return super().create(validated_data)
+        items = validated_data.pop('positions')
+        prices = load_prices([items])
+        validated_data.setdefault('status', 'new')
+        order = Order.objects.create(
+            creator=self.context['request'].user,
+            total=positions_total(items, prices),
+            **validated_data
+        )
+        create_positions([(order, items)], prices)
+        return order
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        if self.instance is not None:
-            self.instance = self.update(self.instance, validated_data)
-            assert self.instance is not None, ()
-        else:
-            self.instance = self.create(validated_data)
-            assert self.instance is not None, ()
-        return self.instance
-
-    def validate(self, data):
-        positions = getattr('positions')
-        if not positions:
-            raise ValidationError({'products': 'Ваша корзина пуста'})
+        items = validated_data.pop('positions', None)
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        if items is not None:
+            prices = load_prices([items])
+            # итог задается ниже; сводки - по товарам удаляемых позиций, новые отметит post_save заказа
+            mark_sales(positions=[(instance.pk, product_id)
+                                  for product_id in instance.positions.values_list('product_id', flat=True)])
+            with positions_replaced():
+                instance.positions.all().delete()
+            instance.total = positions_total(items, prices)
+            create_positions([(instance, items)], prices)
+        instance.save()
+        return instance
+
 
+DUPLICATE_REVIEW = 'Мы уже получили ваш отзыв. Спасибо!'
 
-class ReviewSerializer(serializers.ModelSerializer):
-    creator = serializers.ReadOnlyField(source='creator.id')
+
+class ReviewSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    creator = serializers.ReadOnlyField(source='creator_id')
     rating = serializers.IntegerField(min_value=1, max_value=5)
 
+    expandable_fields = {
+        'creator': (UserSummarySerializer, 'creator'),
+        'review_product': (ProductSummarySerializer, 'review_product'),
+    }
+
     class Meta:
         model = ProductReview
         fields = '__all__'
 
     def create(self, validated_data):
-        return super().create(validated_data)
+        validated_data['creator'] = self.context['request'].user
+        return save_review(lambda: super(ReviewSerializer, self).create(validated_data),
+                           validated_data['creator'].pk, validated_data['review_product'])
+
+    def update(self, instance, validated_data):
+        return save_review(lambda: super(ReviewSerializer, self).update(instance, validated_data),
+                           instance.creator_id, validated_data.get('review_product', instance.review_product_id))
+
+
+def save_review(save, creator_id, review_product):
+    """
+    Повторный отзыв отсекает уникальный индекс (creator, review_product), а
+    не запрос перед вставкой. Существование проверяется только после
+    конфликта, чтобы не выдать нарушение другого ограничения за повтор.
+    """
+    try:
+        with transaction.atomic():
+            return save()
+    except IntegrityError:
+        if ProductReview.objects.filter(creator_id=creator_id, review_product=review_product).exists():
+            raise ValidationError(DUPLICATE_REVIEW)
+        raise
+
+
+def collection_product_ids(collection_ids):
+    """id товаров подборок прямо из промежуточной таблицы, без чтения строк товаров."""
+    product_ids = {pk: [] for pk in collection_ids}
+    rows = Collection.products.through.objects.filter(collection_id__in=product_ids).order_by(
+        'collection_id', 'product_id'
+    ).values_list('collection_id', 'product_id')
+    for collection_id, product_id in rows.iterator():
+        product_ids[collection_id].append(product_id)
+    return product_ids
+
 
-    def validate(self, data):
-        data["creator"] = self.context["request"].user
-        user_objects = ProductReview.objects.filter(creator=self.context["request"].user,
-                                                    review_product=data["review_product"]).count()
-        if self.context['request'].method == 'POST' and user_objects >= 1:
-            raise ValidationError('Мы уже получили ваш отзыв. Спасибо!')
+class CollectionProductsField(serializers.ManyRelatedField):
+    """
+    Запись - как у PrimaryKeyRelatedField(many=True). При чтении id берутся
+    из промежуточной таблицы, а с ``?expand=products`` вместо id выводятся
+    первые ``expand_limit`` товаров из снимка каталога; остальные доступны
+    постранично в ``/collections/<id>/products/``.
+    """
+    expand_limit = 100
 
+    def get_attribute(self, instance):
+        product_ids = getattr(instance, 'product_ids', None)
+        if product_ids is None:
+            product_ids = collection_product_ids([instance.pk])[instance.pk]
+        return product_ids
 
-class CollectionSerializer(serializers.ModelSerializer):
+    def to_representation(self, product_ids):
+        request = self.context.get('request')
+        if request is None or 'products' not in expanded_fields(request):
+            return list(product_ids)
+        batch = product_ids[:self.expand_limit]
+        records = catalogue.get_many(batch)
+        return ProductSummarySerializer([records[pk] for pk in batch if pk in records], many=True).data
+
+
+class CollectionListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        # id товаров всей страницы одним запросом к промежуточной таблице
+        collections = list(data.all() if hasattr(data, 'all') else data)
+        product_ids = collection_product_ids([collection.pk for collection in collections])
+        for collection in collections:
+            collection.product_ids = product_ids[collection.pk]
+        return super().to_representation(collections)
+
+
+class CollectionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    products = CollectionProductsField(
+        child_relation=serializers.PrimaryKeyRelatedField(queryset=Product.objects.all()),
+    )
+
+    # товары разворачивает само поле CollectionProductsField
+    expandable_fields = {'products': None}
+    fast_many = {'products': collection_product_ids}
 
     class Meta:
         model = Collection
         fields = '__all__'
+        list_serializer_class = CollectionListSerializer
+
+
+class SalesSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        # поля общие для DailySales и HourlySales
+        model = DailySales
+        fields = ('period', 'product', 'status', 'revenue', 'units', 'orders')
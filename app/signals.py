@@ -0,0 +1,156 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .cache import invalidate
+from .catalogue import evict_products
+from .models import Collection, Order, Product, ProductPosition, ProductReview
+from .reports import mark_sales
+from .search import index_product, unindex_product
+
+# пока позиции заказа заменяются целиком, сигналы отдельных позиций не
+# пересчитывают итог и продажи: это делает сохранение самого заказа
+replacing_positions = ContextVar('replacing_positions', default=False)
+
+
+@contextmanager
+def positions_replaced():
+    token = replacing_positions.set(True)
+    try:
+        yield
+    finally:
+        replacing_positions.reset(token)
+
+
+@receiver(post_save, sender=ProductPosition)
+@receiver(post_delete, sender=ProductPosition)
+def update_order_total(sender, instance, **kwargs):
+    if replacing_positions.get():
+        return
+    Order.objects.filter(pk=instance.order_id).update_totals()
+
+
+@receiver(post_save, sender=ProductPosition)
+@receiver(post_delete, sender=ProductPosition)
+def update_position_sales(sender, instance, **kwargs):
+    if replacing_positions.get():
+        return
+    mark_sales(positions=[(instance.order_id, instance.product_id)])
+
+
+@receiver(post_save, sender=Order)
+def update_order_sales(sender, instance, **kwargs):
+    # позиции нового заказа создаются bulk_create без сигналов, после сохранения заказа
+    mark_sales(order_ids=[instance.pk])
+
+
+@receiver(pre_delete, sender=Order)
+def remember_deleted_order_sales(sender, instance, **kwargs):
+    # позиции удаляются каскадом, а к пересчету заказа с его created_at уже не будет
+    mark_sales(created={instance.pk: instance.created_at})
+
+
+@receiver(post_save, sender=Product)
+def update_open_positions_price(sender, instance, created, **kwargs):
+    if created:
+        return
+    order_ids = Product.objects.filter(pk=instance.pk).sync_open_positions()
+    if order_ids:
+        mark_sales(order_ids=order_ids)
+
+
+@receiver(post_save, sender=Product)
+def update_product_search_index(sender, instance, **kwargs):
+    index_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_search_index(sender, instance, **kwargs):
+    unindex_product(instance)
+
+
+def invalidate_cache(namespace, pks=()):
+    # второй сброс после коммита убирает ответы, закэшированные конкурентными
+    # запросами, пока транзакция еще не была видна
+    pks = list(pks)
+    invalidate(namespace, pks)
+    transaction.on_commit(lambda: invalidate(namespace, pks))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_cache(sender, instance, **kwargs):
+    invalidate_cache('products', [instance.pk])
+    evict_products([instance.pk])
+
+
+@receiver(pre_delete, sender=Product)
+def invalidate_product_collections_cache(sender, instance, **kwargs):
+    # строки M2M удаляются каскадом без сигнала m2m_changed
+    instance._collection_ids = list(instance.collection_set.values_list('pk', flat=True))
+    invalidate_cache('collections', instance._collection_ids)
+
+
+@receiver(post_delete, sender=Product)
+def update_product_collections_count(sender, instance, **kwargs):
+    collection_ids = getattr(instance, '_collection_ids', None)
+    if collection_ids:
+        Collection.objects.filter(pk__in=collection_ids).update_product_counts()
+
+
+@receiver(post_save, sender=Collection)
+@receiver(post_delete, sender=Collection)
+def invalidate_collection_cache(sender, instance, **kwargs):
+    invalidate_cache('collections', [instance.pk])
+
+
+@receiver(m2m_changed, sender=Collection.products.through)
+def update_collection_products(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            Collection.objects.filter(pk=instance.pk).update_product_counts()
+            instance.refresh_from_db(fields=['product_count'])
+            invalidate_cache('collections', [instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        Collection.objects.filter(pk__in=pk_set).update_product_counts()
+        invalidate_cache('collections', pk_set)
+    elif action == 'pre_clear':
+        instance._collection_ids = list(instance.collection_set.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        collection_ids = getattr(instance, '_collection_ids', [])
+        Collection.objects.filter(pk__in=collection_ids).update_product_counts()
+        invalidate_cache('collections', collection_ids)
+
+
+@receiver(pre_save, sender=ProductReview)
+def remember_review_rating(sender, instance, **kwargs):
+    instance._previous_rating = None
+    if not instance._state.adding:
+        instance._previous_rating = ProductReview.objects.filter(pk=instance.pk).values_list(
+            'review_product_id', 'rating'
+        ).first()
+
+
+@receiver(post_save, sender=ProductReview)
+def update_rating_on_save(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_rating', None)
+    current = (instance.review_product_id, instance.rating)
+    if previous == current:
+        return
+    product_ids = {current[0]}
+    if previous is not None:
+        Product.objects.filter(pk=previous[0]).apply_review(previous[1], -1)
+        product_ids.add(previous[0])
+    Product.objects.filter(pk=current[0]).apply_review(current[1])
+    invalidate_cache('products', product_ids)
+    evict_products(product_ids)
+
+
+@receiver(post_delete, sender=ProductReview)
+def update_rating_on_delete(sender, instance, **kwargs):
+    Product.objects.filter(pk=instance.review_product_id).apply_review(instance.rating, -1)
+    invalidate_cache('products', [instance.review_product_id])
+    evict_products([instance.review_product_id])
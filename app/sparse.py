@@ -0,0 +1,147 @@
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.serializers import ListSerializer
+
+
+def split_param(request, name):
+    return {value.strip() for value in request.query_params.get(name, '').split(',') if value.strip()}
+
+
+def requested_fields(request):
+    """Поля из ``?fields=``; пустое множество - все поля."""
+    return split_param(request, 'fields')
+
+
+def expanded_fields(request):
+    return split_param(request, 'expand')
+
+
+def is_sparse_request(request):
+    return request is not None and request.method in SAFE_METHODS
+
+
+class SparseFieldsMixin:
+    """
+    Для GET ``?fields=id,name`` оставляет в ответе только перечисленные поля,
+    а ``?expand=creator`` заменяет id связанного объекта вложенным объектом.
+
+    ``expandable_fields`` - имя поля: (сериализатор, путь select_related)
+    или None, если поле разворачивается само. ``sparse_columns`` и
+    ``sparse_prefetch`` - колонки и prefetch для полей, которые нельзя
+    вывести из ``source`` (методы, свойства модели).
+    """
+    expandable_fields = {}
+    sparse_columns = {}
+    sparse_prefetch = {}
+
+    def is_response_root(self):
+        parent = self.parent
+        if isinstance(parent, ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if not is_sparse_request(request) or not self.is_response_root():
+            return fields
+
+        for name in expanded_fields(request):
+            expanded = self.expandable_fields.get(name)
+            if expanded is not None:
+                fields[name] = expanded[0](read_only=True)
+        requested = requested_fields(request)
+        if requested:
+            for name in list(fields):
+                if name not in requested:
+                    del fields[name]
+        return fields
+
+
+def is_model_field(model, name):
+    try:
+        model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return False
+    return True
+
+
+def field_requirements(serializer, model):
+    """Колонки для .only(), пути select_related и корни prefetch для каждого поля сериализатора."""
+    requirements = {}
+    for name, field in serializer.fields.items():
+        columns, related, prefetch = list(serializer.sparse_columns.get(name, ())), set(), set()
+        if name in serializer.sparse_prefetch:
+            prefetch.add(serializer.sparse_prefetch[name])
+        elif name not in serializer.sparse_columns and field.source != '*':
+            root, _, rest = field.source.partition('.')
+            try:
+                model_field = model._meta.get_field(root)
+            except FieldDoesNotExist:
+                model_field = None
+            if model_field is not None and (model_field.many_to_many or model_field.one_to_many):
+                prefetch.add(root)
+            elif model_field is not None:
+                columns.append(root)
+                if rest:
+                    related.add(root)
+                    columns.append('{}__{}'.format(root, rest.replace('.', '__')))
+        requirements[name] = (columns, related, prefetch)
+    return requirements
+
+
+class SparseQuerysetMixin:
+    """
+    Для list/retrieve сужает SQL под ``?fields=`` / ``?expand=``:
+    .only() по выводимым колонкам, select_related только для нужных
+    связей и prefetch только для выводимых вложенных списков.
+    """
+    sparse_actions = ('list', 'retrieve')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        request = self.request
+        if self.action not in self.sparse_actions or not is_sparse_request(request):
+            return queryset
+        fields, expand = requested_fields(request), expanded_fields(request)
+        if not fields and not expand:
+            return queryset
+
+        serializer_class = self.get_serializer_class()
+        serializer = serializer_class(context={'request': None})
+        unknown = sorted(fields - set(serializer.fields) - set(serializer_class.expandable_fields))
+        if unknown:
+            raise ValidationError({'fields': 'Неизвестные поля: {}'.format(', '.join(unknown))})
+        unknown = sorted(expand - set(serializer_class.expandable_fields))
+        if unknown:
+            raise ValidationError({'expand': 'Нельзя развернуть: {}'.format(', '.join(unknown))})
+
+        requirements = field_requirements(serializer, queryset.model)
+        columns, related, prefetch = set(), set(), set()
+        for name in fields or requirements:
+            if name in expand and serializer_class.expandable_fields[name] is not None:
+                summary_class, path = serializer_class.expandable_fields[name]
+                related.add(path)
+                columns.add(path)
+                columns.update('{}__{}'.format(path, field) for field in summary_class().fields)
+                continue
+            field_columns, field_related, field_prefetch = requirements.get(name, ((), (), ()))
+            columns.update(field_columns)
+            related.update(field_related)
+            prefetch.update(field_prefetch)
+
+        # колонки сортировки нужны курсору пагинации
+        ordering = self.get_ordering() if hasattr(self, 'get_ordering') else getattr(self, 'ordering', ())
+        for field in ordering or ():
+            field = field.lstrip('-')
+            if field not in ('pk', 'id') and is_model_field(queryset.model, field):
+                columns.add(field)
+
+        queryset = queryset.select_related(None)
+        if related:
+            queryset = queryset.select_related(*sorted(related))
+        lookups = [lookup for lookup in queryset._prefetch_related_lookups
+                   if str(getattr(lookup, 'prefetch_through', lookup)).split('__')[0] in prefetch]
+        queryset = queryset.prefetch_related(None).prefetch_related(*lookups)
+        return queryset.only(*sorted(columns) or ['pk'])
@@ -1,6 +1,8 @@
+from django.urls import path
 from rest_framework.routers import SimpleRouter
 
-from .views import OrderViewSet, ProductViewSet, ReviewViewSet, CollectionViewSet
+from .views import (OrderViewSet, ProductViewSet, ReviewViewSet, CollectionViewSet, DatabasePoolView, CatalogueStatsView,
+                    SalesReportView)
 
 router = SimpleRouter()
 
@@ -9,4 +11,8 @@ router.register('products', ProductViewSet, basename='products')
 router.register('reviews', ReviewViewSet, basename='reviews')
 router.register('collections', CollectionViewSet, basename='collections')
 
-urlpatterns = router.urls
+urlpatterns = router.urls + [
+    path('db-pool/', DatabasePoolView.as_view(), name='db-pool'),
+    path('catalogue-stats/', CatalogueStatsView.as_view(), name='catalogue-stats'),
+    path('reports/sales/', SalesReportView.as_view(), name='reports-sales'),
+]
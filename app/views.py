@@ -1,82 +1,266 @@
-from rest_framework.decorators import permission_classes
+import os
+
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import Http404
+from rest_framework import status
+from rest_framework.decorators import action, permission_classes
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.generics import ListAPIView
+from rest_framework.parsers import MultiPartParser
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
-from .models import Product, Order, ProductReview, Collection
-from .permissions import AllowOnly
-from .serializers import ProductSerializer, OrderSerializer, ReviewSerializer, CollectionSerializer
-from .filters import ProductFilter, OrderFilter, ReviewFilter
+from .cache import CachedReadMixin
+from .catalogue import catalogue, is_enabled as catalogue_enabled
+from .export import ExportMixin
+from .fast import FastListMixin
+from .imports import FORMATS as IMPORT_FORMATS, IMPORT_TASK, import_job_state, queue_import
+from .models import Product, Order, ProductPosition, ProductReview, Collection, Job
+from .permissions import ActionPermissionsMixin, AllowOnly
+from .pool import pool_stats
+from .pagination import MembershipPagination
+from .reports import GRAINS, mark_sales
+from .sparse import SparseQuerysetMixin
+from .serializers import ProductSerializer, OrderSerializer, ReviewSerializer, CollectionSerializer, ProductSummarySerializer, SalesSerializer
+from .filters import ProductFilter, OrderFilter, ReviewFilter, SalesFilter
 
 
-class ProductViewSet(ModelViewSet):
+class ProductViewSet(ActionPermissionsMixin, SparseQuerysetMixin, CachedReadMixin, FastListMixin, ExportMixin, ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     filterset_class = ProductFilter
+    cache_namespace = 'products'
+    page_size = 50
+    ordering = ('created_at', 'pk')
+    ordering_fields = ('created_at', 'price', 'rating_avg', 'review_count')
+    export_csv_fields = ('id', 'sku', 'name', 'desc', 'price', 'review_count', 'rating_avg', 'created_at', 'updated_at')
+    query_budget = {'list': 1, 'retrieve': 1}
 
     permission_classes_by_action = {'retrieve': [AllowAny],
                                     'list': [AllowAny],
                                     'create': [IsAdminUser],
                                     'update': [IsAdminUser],
                                     'destroy': [IsAdminUser],
+                                    'export': [IsAdminUser],
+                                    'import_catalogue': [IsAdminUser],
+                                    'import_status': [IsAdminUser],
                                     }
+    import_chunk_size = 1000
+
+    def get_ordering(self):
+        if self.request.query_params.get('search', '').strip():
+            return ('-search_rank', 'pk')
+        ordering = self.request.query_params.get('ordering', '').strip()
+        if ordering.lstrip('-') in self.ordering_fields:
+            return (ordering, '-pk' if ordering.startswith('-') else 'pk')
+        return self.ordering
 
-    def get_permissions(self):
+    def get_object(self):
+        # карточка товара без фильтров читается из снимка каталога
+        if self.action != 'retrieve' or set(self.request.query_params) - {'fields'} or not catalogue_enabled():
+            return super().get_object()
         try:
-            return [permission() for permission in self.permission_classes_by_action[self.action]]
-        except KeyError:
-            return [permission() for permission in self.permission_classes]
+            record = catalogue.get(int(self.kwargs[self.lookup_url_kwarg or self.lookup_field]))
+        except ValueError:
+            record = None
+        if record is None:
+            raise Http404
+        self.check_object_permissions(self.request, record)
+        return record
+
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def import_catalogue(self, request):
+        """
+        Ставит импорт каталога из файла ``file`` (CSV или NDJSON, см. app.imports)
+        в очередь задач. Ответ 202 с id задачи; ход импорта - в import_status.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ValidationError({'file': 'Загрузите файл каталога'})
+        import_format = request.data.get('import_format') or os.path.splitext(upload.name)[1].lstrip('.').lower()
+        if import_format not in IMPORT_FORMATS:
+            raise ValidationError({'import_format': 'Допустимые значения: {}'.format(', '.join(IMPORT_FORMATS))})
+        job = queue_import(upload, import_format, self.import_chunk_size)
+        return Response(import_job_state(job), status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['get'], url_path=r'import/(?P<job_id>\d+)')
+    def import_status(self, request, job_id):
+        """Статус задачи импорта и счетчики по уже обработанным пачкам."""
+        job = Job.objects.filter(pk=job_id, name=IMPORT_TASK).first()
+        if job is None:
+            raise Http404
+        return Response(import_job_state(job))
+
+
+def positions_prefetch():
+    # без снимка каталога название позиции берется из товара: товары тем же prefetch
+    if catalogue_enabled():
+        return 'positions'
+    return Prefetch('positions', queryset=ProductPosition.objects.select_related('product'))
 
 
-class OrderViewSet(ModelViewSet):
-    queryset = Order.objects.prefetch_related('order').all()
+class OrderViewSet(ActionPermissionsMixin, SparseQuerysetMixin, ExportMixin, ModelViewSet):
+    queryset = Order.objects.select_related('creator').prefetch_related('positions').all()
     serializer_class = OrderSerializer
     filterset_class = OrderFilter
+    page_size = 20
+    ordering = ('-created_at', '-pk')
+    query_budget = {'list': 3, 'retrieve': 3}
+    max_batch_size = 500
+    owner_field = 'creator'
+    export_csv_fields = ('id', 'created_at', 'updated_at', 'creator', 'status', 'total',
+                         'positions.product_id', 'positions.name', 'positions.quantity', 'positions.price')
 
     permission_classes_by_action = {'retrieve': [AllowOnly],
                                     'list': [IsAuthenticated],
                                     'create': [IsAuthenticated],
+                                    'bulk_create': [IsAuthenticated],
                                     'update': [IsAdminUser],
                                     'destroy': [IsAdminUser],
+                                    'export': [IsAdminUser],
+                                    'bulk_status': [IsAdminUser],
                                     }
 
-    def get_permissions(self):
-        try:
-            return [permission() for permission in self.permission_classes_by_action[self.action]]
-        except KeyError:
-            return [permission() for permission in self.permission_classes]
+    @property
+    def export_prefetch(self):
+        return (positions_prefetch(),)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if 'positions' not in queryset._prefetch_related_lookups:
+            return queryset
+        lookups = [positions_prefetch() if lookup == 'positions' else lookup
+                   for lookup in queryset._prefetch_related_lookups]
+        return queryset.prefetch_related(None).prefetch_related(*lookups)
+
+    @action(detail=False, methods=['post'], url_path='status')
+    def bulk_status(self, request):
+        """
+        Переводит заказы ``ids`` в статус ``status`` по ``Order.TRANSITIONS``
+        и возвращает результат по каждому id.
+        """
+        target = request.data.get('status')
+        ids = request.data.get('ids')
+        if target not in Order.TRANSITIONS:
+            raise ValidationError({'status': 'Допустимые статусы: {}'.format(', '.join(Order.TRANSITIONS))})
+        if not isinstance(ids, list) or not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+            raise ValidationError({'ids': 'Ожидается список id заказов'})
+        if len(ids) > self.max_batch_size:
+            raise ValidationError({'ids': 'Не больше {} заказов за один запрос'.format(self.max_batch_size)})
+
+        results = Order.objects.transition(ids, target)
+        mark_sales(order_ids=[pk for pk, (result, _) in results.items() if result == 'updated'])
+        return Response([
+            {'id': pk, 'result': result, 'status': current} for pk, (result, current) in results.items()
+        ])
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_create(self, request):
+        if not isinstance(request.data, list):
+            raise ValidationError('Ожидается список заказов')
+        if len(request.data) > self.max_batch_size:
+            raise ValidationError('Не больше {} заказов за один запрос'.format(self.max_batch_size))
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
-class ReviewViewSet(ModelViewSet):
-    queryset = ProductReview.objects.select_related('review_product').all()
+class ReviewViewSet(ActionPermissionsMixin, SparseQuerysetMixin, FastListMixin, ModelViewSet):
+    queryset = ProductReview.objects.all()
     serializer_class = ReviewSerializer
     filterset_class = ReviewFilter
+    page_size = 50
+    ordering = ('-created_at', '-pk')
+    query_budget = {'list': 1, 'retrieve': 1}
 
     permission_classes_by_action = {'retrieve': [AllowAny],
                                     'list': [IsAuthenticated],
                                     'create': [IsAuthenticated],
                                     'update': [AllowOnly],
-                                    'destroy': [AllowOnly]
+                                    'destroy': [AllowOnly],
+                                    'upsert': [IsAuthenticated],
                                     }
 
-    def get_permissions(self):
-        try:
-            return [permission() for permission in self.permission_classes_by_action[self.action]]
-        except KeyError:
-            return [permission() for permission in self.permission_classes]
+    @action(detail=False, methods=['put'], url_path=r'by-product/(?P<product_id>\d+)')
+    def upsert(self, request, product_id=None):
+        """Создает отзыв текущего пользователя о товаре или заменяет существующий."""
+        data = request.data.copy()
+        data['review_product'] = product_id
+        with transaction.atomic():
+            # строка отзыва блокируется до замены; одновременная вставка упрется в уникальный индекс
+            instance = ProductReview.objects.select_for_update().filter(
+                creator=request.user, review_product_id=product_id
+            ).first()
+            serializer = self.get_serializer(instance, data=data)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+        return Response(serializer.data, status=status.HTTP_200_OK if instance else status.HTTP_201_CREATED)
 
 
-class CollectionViewSet(ModelViewSet):
-    queryset = Collection.objects.prefetch_related('products').all()
+class CollectionViewSet(ActionPermissionsMixin, SparseQuerysetMixin, CachedReadMixin, FastListMixin, ModelViewSet):
+    queryset = Collection.objects.all()
     serializer_class = CollectionSerializer
+    cache_namespace = 'collections'
+    page_size = 20
+    ordering = ('created_at', 'pk')
+    query_budget = {'list': 2, 'retrieve': 2}
 
     permission_classes_by_action = {'retrieve': [AllowAny],
                                     'list': [AllowAny],
                                     'create': [IsAdminUser],
                                     'update': [IsAdminUser],
                                     'destroy': [IsAdminUser],
+                                    'products': [AllowAny],
                                     }
 
-    def get_permissions(self):
-        try:
-            return [permission() for permission in self.permission_classes_by_action[self.action]]
-        except KeyError:
-            return [permission() for permission in self.permission_classes]
+    @action(detail=True, methods=['get'])
+    def products(self, request, pk=None):
+        """Товары подборки страницами по ``MembershipPagination.page_size`` (id, название, цена)."""
+        collection = self.get_object()
+        rows = Collection.products.through.objects.filter(collection_id=collection.pk)
+        paginator = MembershipPagination()
+        page = paginator.paginate_queryset(rows, request)
+        records = catalogue.get_many([row.product_id for row in page])
+        data = ProductSummarySerializer(
+            [records[row.product_id] for row in page if row.product_id in records], many=True
+        ).data
+        return paginator.get_paginated_response(data)
+
+
+class DatabasePoolView(APIView):
+    """Метрики пула соединений обрабатывающего запрос процесса (app.pool)."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(pool_stats())
+
+
+class CatalogueStatsView(APIView):
+    """Счетчики попаданий снимка каталога в процессе, обработавшем запрос (app.catalogue)."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(catalogue.stats())
+
+
+class SalesReportView(ListAPIView):
+    """
+    Выручка, штуки и число заказов по товару, периоду и статусу заказа из
+    сводок app.reports. ``?grain=day`` (по умолчанию) или ``hour``, фильтры
+    ``date_from``/``date_to`` (начало периода), ``product``, ``status``.
+    """
+    permission_classes = [IsAdminUser]
+    serializer_class = SalesSerializer
+    filterset_class = SalesFilter
+    page_size = 200
+    ordering = ('period', 'pk')
+    query_budget = 1
+
+    def get_queryset(self):
+        grain = self.request.query_params.get('grain', 'day')
+        if grain not in GRAINS:
+            raise ValidationError({'grain': 'Допустимые значения: {}'.format(', '.join(GRAINS))})
+        return GRAINS[grain][0].objects.all()
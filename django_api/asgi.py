@@ -14,3 +14,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_api.settings')
 
 application = get_asgi_application()
+
+# снимок каталога загружается только в процессах, которые обслуживают запросы,
+# а не в manage.py migrate/check/run_jobs
+from app.catalogue import warm_catalogue  # noqa: E402
+
+warm_catalogue()
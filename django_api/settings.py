@@ -38,7 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
 
-    'app',
+    'app.apps.AppConfig',
     'rest_framework',
     'rest_framework.authtoken',
     'rest_auth',
@@ -51,8 +51,10 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'app.routers.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'app.middleware.QueryBudgetMiddleware',
 ]
 
 ROOT_URLCONF = 'django_api.urls'
@@ -81,13 +83,29 @@ WSGI_APPLICATION = 'django_api.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'app.backends.postgresql_pool',
         'NAME': 'netology_diploma',
         'HOST': '127.0.0.1',
         'PORT': '5432',
+        # пул соединений на процесс, см. app.pool. CONN_MAX_AGE остается 0:
+        # в конце запроса соединение возвращается в пул
+        'POOL': {
+            'MIN_SIZE': 2,
+            'MAX_SIZE': 10,
+            'TIMEOUT': 10,
+            'MAX_IDLE': 300,
+            'MAX_LIFETIME': 3600,
+            'CHECK_INTERVAL': 30,
+        },
     }
 }
 
+# Реплики для чтения: alias из DATABASES, см. app.routers.ReplicaRouter.
+# После записи клиент читает с основной БД еще REPLICA_STICKY_SECONDS секунд.
+DATABASE_ROUTERS = ['app.routers.ReplicaRouter']
+DATABASE_REPLICAS = []
+REPLICA_STICKY_SECONDS = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -108,6 +126,35 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# Для нескольких процессов укажите общий backend (Memcached, Redis) в отдельном alias
+# и пропишите его в API_CACHE_ALIAS.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Кэш ответов list/retrieve для анонимных пользователей, см. app.cache.CachedReadMixin.
+API_CACHE_ENABLED = True
+API_CACHE_ALIAS = 'default'
+API_CACHE_TIMEOUT = 300
+
+# Снимок каталога товаров в памяти процесса (app.catalogue): загружается при
+# старте и догружает изменения по updated_at не чаще раза в CATALOGUE_REFRESH_SECONDS
+CATALOGUE_CACHE_ENABLED = True
+CATALOGUE_REFRESH_SECONDS = 5
+
+# Загруженные через API файлы каталога до выполнения задачи импорта (app.imports).
+# Воркеры run_jobs должны видеть этот каталог.
+CATALOGUE_IMPORT_DIR = BASE_DIR / 'imports'
+
+# list товаров, отзывов и подборок из .values() без ModelSerializer (app.fast)
+FAST_SERIALIZER_ENABLED = True
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/3.2/topics/i18n/
 
@@ -127,6 +174,28 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+
+# Django REST framework
+# https://www.django-rest-framework.org/api-guide/settings/
+
+REST_FRAMEWORK = {
+    'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
+    'DEFAULT_PAGINATION_CLASS': 'app.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
+}
+
+# Режим совместимости пагинации: список в теле ответа, курсоры в заголовке Link.
+# См. app.pagination.KeysetPagination.
+PAGINATION_LIST_COMPAT = False
+
+# Подсчет SQL-запросов на запрос и поиск N+1, см. app.middleware.QueryBudgetMiddleware.
+QUERY_BUDGET_ENABLED = DEBUG
+QUERY_BUDGET_REPEAT_THRESHOLD = 3
+
+# Конфигурация полнотекстового поиска PostgreSQL для товаров, см. app.search.
+# После смены на существующей базе: manage.py reindex_product_search.
+PRODUCT_SEARCH_CONFIG = 'russian'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
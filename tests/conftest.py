@@ -1,4 +1,5 @@
 import pytest
+from django.conf import settings
 from rest_framework.test import APIClient
 from model_bakery import baker
 
@@ -8,6 +9,25 @@ def api_client():
     return APIClient()
 
 
+@pytest.fixture
+def user(django_user_model):
+    return django_user_model.objects.create_user(username='user', password='password')
+
+
+@pytest.fixture
+def api_user(django_user_model):
+    client = APIClient()
+    client.force_authenticate(django_user_model.objects.create_user(username='api_user', password='password'))
+    return client
+
+
+@pytest.fixture
+def api_admin(admin_user):
+    client = APIClient()
+    client.force_authenticate(admin_user)
+    return client
+
+
 @pytest.fixture
 def product_factory():
     def factory(**kwargs):
@@ -35,3 +55,46 @@ def collection_factory():
         return baker.make('Collection', **kwargs)
     return factory
 
+
+
+@pytest.fixture(autouse=True)
+def pagination_list_compat(settings):
+    # старые тесты читают resp.json() как список
+    settings.PAGINATION_LIST_COMPAT = True
+
+
+@pytest.fixture
+def assert_query_budget(settings):
+    settings.QUERY_BUDGET_ENABLED = True
+
+    def check(response):
+        report = response.query_report
+        if report['over_budget'] or report['repeated']:
+            pytest.fail('Превышен бюджет запросов: {}'.format(report))
+        return report
+    return check
+
+
+@pytest.fixture(autouse=True)
+def clear_api_cache():
+    from app.cache import get_cache
+    get_cache().clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_catalogue():
+    from app.catalogue import catalogue
+    catalogue.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_pending_sales():
+    # в тестовой транзакции on_commit не срабатывает, и отметки копились бы между тестами
+    from app.reports import pending
+    pending.reset()
+
+
+@pytest.fixture(scope='session')
+def django_db_modify_db_settings(django_db_modify_db_settings_parallel_suffix):
+    # реплика для тестов маршрутизации: второй alias на ту же тестовую БД
+    settings.DATABASES['replica'] = dict(settings.DATABASES['default'], TEST={'MIRROR': 'default'})
@@ -1,7 +1,31 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 import pytest
-from rest_framework.status import HTTP_200_OK, HTTP_401_UNAUTHORIZED, HTTP_204_NO_CONTENT, HTTP_403_FORBIDDEN, HTTP_201_CREATED, HTTP_400_BAD_REQUEST
-from app.models import Product
+from rest_framework.status import HTTP_304_NOT_MODIFIED, HTTP_200_OK, HTTP_401_UNAUTHORIZED, HTTP_204_NO_CONTENT, HTTP_403_FORBIDDEN, HTTP_201_CREATED, HTTP_202_ACCEPTED, HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from app.cache import get_cache, version_key
+from app.catalogue import catalogue
+from app.fast import NativeJSONRenderer
+from app.imports import import_products
+from app.middleware import QueryCounter
+from app.pagination import EstimatedCountPaginator
+from app.pool import ConnectionPool, PoolTimeout
+from app.jobs import TASKS, Worker, claim, create_job, requeue_stale, run_job
+from app.reports import flush_sales
+from app.models import Collection, DailySales, HourlySales, Job, Order, Product, ProductPosition, ProductReview
+from app.serializers import OrderSerializer, ProductSerializer
+from app.routers import PIN_COOKIE, ReplicaRouter, ReplicaRoutingMiddleware
+from app.views import OrderViewSet, ReviewViewSet
 
 
 @pytest.mark.django_db
@@ -128,6 +152,99 @@ def test_product_get(api_client, product_factory):
     assert resp_json['id'] == product.id
 
 
+# тест на ранжированный поиск товаров
+@pytest.mark.django_db
+def test_product_search(api_client, product_factory):
+    phone = product_factory(name='Смартфон Pixel', desc='камера')
+    case = product_factory(name='Чехол', desc='чехол для смартфона Pixel')
+    product_factory(name='Молоко', desc='пастеризованное')
+    url = reverse('products-list')
+
+    resp = api_client.get(url, {'search': 'pixel'})
+    assert resp.status_code == HTTP_200_OK
+    assert [item['id'] for item in resp.json()] == [phone.id, case.id]
+
+    resp = api_client.get(url, {'search': 'чехол pixel'})
+    assert [item['id'] for item in resp.json()] == [case.id]
+
+
+# тест на обновление поискового индекса при сохранении товара
+@pytest.mark.django_db
+def test_product_search_index_updates_on_save(api_client, product_factory):
+    product = product_factory(name='Кефир')
+    product.name = 'Ряженка'
+    product.save()
+    url = reverse('products-list')
+    assert api_client.get(url, {'search': 'кефир'}).json() == []
+    assert [item['id'] for item in api_client.get(url, {'search': 'ряженка'}).json()] == [product.id]
+
+
+# тест на восстановление поискового индекса командой reindex_product_search
+@pytest.mark.django_db
+def test_reindex_product_search(api_client, product_factory):
+    products = product_factory(_quantity=3, name='Творог')
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM app_product_fts')
+
+    call_command('reindex_product_search', chunk_size=2)
+    url = reverse('products-list')
+    assert sorted(item['id'] for item in api_client.get(url, {'search': 'творог'}).json()) == [p.id for p in products]
+
+
+# тест на кэш ответа и ETag для анонимного пользователя
+@pytest.mark.django_db
+def test_product_get_cached_etag(api_client, product_factory, django_assert_num_queries):
+    product = product_factory()
+    url = reverse("products-detail", args=(product.id,))
+    resp = api_client.get(url)
+    etag = resp['ETag']
+
+    with django_assert_num_queries(0):
+        resp = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert resp.status_code == HTTP_304_NOT_MODIFIED
+
+    product.name = 'Новое название'
+    product.save()
+    resp = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert resp.status_code == HTTP_200_OK
+    assert resp.json()['name'] == 'Новое название'
+    assert resp['ETag'] != etag
+
+
+
+
+# тест на то, что запись одного товара не сбрасывает кэш карточки другого
+@pytest.mark.django_db
+def test_product_retrieve_cache_is_per_object(api_client, product_factory, django_assert_num_queries, settings):
+    settings.CATALOGUE_CACHE_ENABLED = False
+    first, second = product_factory(_quantity=2)
+    first_url = reverse("products-detail", args=(first.id,))
+    second_url = reverse("products-detail", args=(second.id,))
+    api_client.get(first_url)
+    api_client.get(second_url)
+    first.name = 'Новое название'
+    first.save()
+    with django_assert_num_queries(0):
+        assert api_client.get(second_url).json()['name'] == second.name
+    assert api_client.get(first_url).json()['name'] == 'Новое название'
+
+
+# тест на то, что вытесненный из кэша ключ версии не возвращает старые записи
+@pytest.mark.django_db
+def test_product_cache_version_eviction(api_client, product_factory, settings):
+    settings.CATALOGUE_CACHE_ENABLED = False
+    product = product_factory(name='Старое название')
+    url = reverse("products-detail", args=(product.id,))
+    keys = [version_key('products'), version_key('products', product.pk)]
+    get_cache().delete_many(keys)
+    assert api_client.get(url).json()['name'] == 'Старое название'
+    product.name = 'Новое название'
+    product.save()
+    assert api_client.get(url).json()['name'] == 'Новое название'
+    get_cache().delete_many(keys)
+    assert api_client.get(url).json()['name'] == 'Новое название'
+
+
 # ____________Tests for reviews____________
 # тест на получение всех отзывов
 @pytest.mark.django_db
@@ -218,6 +335,46 @@ def test_update_review_other(api_user, user, review_factory):
     assert resp.status_code == HTTP_403_FORBIDDEN
 
 
+# тест на инкрементальные агрегаты оценок товара
+@pytest.mark.django_db
+def test_product_rating_aggregates(api_client, user, django_user_model, product_factory):
+    product, other = product_factory(_quantity=2)
+    review = ProductReview.objects.create(review_product=product, creator=user, text='ok', rating=4)
+    ProductReview.objects.create(review_product=product, creator=django_user_model.objects.create_user(username='second'),
+                                 text='ok', rating=2)
+
+    resp_json = api_client.get(reverse('products-detail', args=(product.id,))).json()
+    assert resp_json['review_count'] == 2
+    assert resp_json['rating_avg'] == 3
+    assert resp_json['rating_histogram'] == {'1': 0, '2': 1, '3': 0, '4': 1, '5': 0}
+
+    review.rating = 5
+    review.review_product = other
+    review.save()
+    review.delete()
+    product.refresh_from_db()
+    other.refresh_from_db()
+    assert (product.review_count, product.rating_sum, product.rating_2, product.rating_4) == (1, 2, 1, 0)
+    assert (other.review_count, other.rating_sum, other.rating_5) == (0, 0, 0)
+
+    Product.objects.update(review_count=0, rating_sum=0, rating_2=0, rating_avg=0)
+    call_command('rebuild_rating_aggregates')
+    product.refresh_from_db()
+    assert (product.review_count, product.rating_sum, product.rating_2, product.rating_avg) == (1, 2, 1, 2)
+
+
+# тест на фильтр и сортировку по средней оценке
+@pytest.mark.django_db
+def test_product_min_rating_filter_and_ordering(api_client, user, product_factory):
+    products = product_factory(_quantity=3)
+    for product, rating in zip(products, (3, 5, 1)):
+        ProductReview.objects.create(review_product=product, creator=user, text='ok', rating=rating)
+    url = reverse('products-list')
+
+    resp = api_client.get(url, {'min_rating': 3, 'ordering': '-rating_avg'})
+    assert [item['id'] for item in resp.json()] == [products[1].id, products[0].id]
+
+
 # тест на создание двух отзывов к 1 товару
 @pytest.mark.django_db
 def test_review_double_post(apiuser, user, review_factory, product_factory):
@@ -234,6 +391,41 @@ def test_review_double_post(apiuser, user, review_factory, product_factory):
     assert resp_2.status_code == HTTP_400_BAD_REQUEST
 
 
+# тест на повторный отзыв: одна вставка без проверки заранее, конфликт индекса - 400
+@pytest.mark.django_db
+def test_review_duplicate_by_unique_index(api_client, user, product_factory):
+    product = product_factory()
+    api_client.force_authenticate(user)
+    payload = {'review_product': product.id, 'text': 'Хорошо', 'rating': 4}
+    url = reverse('reviews-list')
+
+    assert api_client.post(url, payload).status_code == HTTP_201_CREATED
+    resp = api_client.post(url, payload)
+    assert resp.status_code == HTTP_400_BAD_REQUEST
+    assert resp.json() == ['Мы уже получили ваш отзыв. Спасибо!']
+    assert ProductReview.objects.filter(creator=user).count() == 1
+    product.refresh_from_db()
+    assert product.review_count == 1
+
+
+# тест на замену отзыва через PUT /reviews/by-product/<id>/
+@pytest.mark.django_db
+def test_review_upsert_by_product(api_client, user, product_factory):
+    product = product_factory()
+    api_client.force_authenticate(user)
+    url = reverse('reviews-upsert', args=(product.id,))
+
+    resp = api_client.put(url, {'text': 'Плохо', 'rating': 1})
+    assert resp.status_code == HTTP_201_CREATED
+    review_id = resp.json()['id']
+    resp = api_client.put(url, {'text': 'Отлично', 'rating': 5})
+    assert resp.status_code == HTTP_200_OK
+    assert (resp.json()['id'], resp.json()['text'], resp.json()['creator']) == (review_id, 'Отлично', user.id)
+    product.refresh_from_db()
+    assert (product.review_count, product.rating_1, product.rating_5) == (1, 0, 1)
+    assert api_client.put(reverse('reviews-upsert', args=(product.id + 100,)), {'text': 'x', 'rating': 3}).status_code == HTTP_400_BAD_REQUEST
+
+
 # ____________Tests for orders____________
 
 # тест на получение списка заказов без авторизации
@@ -254,6 +446,31 @@ def test_order_list_auth(api_user):
     assert resp.status_code == HTTP_200_OK
 
 
+# тест на то, что пользователь видит только свои заказы
+@pytest.mark.django_db
+def test_order_list_scoped_by_owner(api_client, user, order_factory):
+    own = order_factory(creator=user, status='new')
+    other = order_factory(status='new')
+    api_client.force_authenticate(user)
+
+    resp = api_client.get(reverse('orders-list'))
+    assert [item['id'] for item in resp.json()] == [own.id]
+    resp = api_client.get(reverse('orders-detail', args=(other.id,)))
+    assert resp.status_code == HTTP_404_NOT_FOUND
+
+
+# тест на проверку владельца отзыва без загрузки пользователя
+@pytest.mark.django_db
+def test_review_owner_check_by_id(user, django_user_model, product_factory, django_assert_num_queries):
+    other = django_user_model.objects.create_user(username='other')
+    review = ProductReview.objects.create(review_product=product_factory(), creator=user, text='ok', rating=3)
+    review = ProductReview.objects.get(pk=review.pk)
+    permission = ReviewViewSet._permissions_by_action['partial_update'][0]
+    with django_assert_num_queries(0):
+        assert permission.has_object_permission(SimpleNamespace(method='PATCH', user=user), None, review)
+        assert not permission.has_object_permission(SimpleNamespace(method='PATCH', user=other), None, review)
+
+
 # тест на создание заказа с авторизацией
 @pytest.mark.django_db
 def test_order_create_auth(api_user, order_factory, product_factory):
@@ -271,6 +488,115 @@ def test_order_create_auth(api_user, order_factory, product_factory):
     assert resp_json['id'] == order_payload['id']
 
 
+# тест на создание заказа: товары одним запросом, позиции через bulk_create
+@pytest.mark.django_db
+def test_order_create_positions_bulk(api_user, product_factory, django_assert_max_num_queries):
+    products = product_factory(_quantity=5, price=10)
+    order_payload = {
+        'positions': [{'product_id': product.id, 'quantity': 2} for product in products],
+    }
+    url = reverse('orders-list')
+    # цены - одним запросом к БД, названия - из снимка каталога (здесь он загружается)
+    with django_assert_max_num_queries(7):
+        resp = api_user.post(url, order_payload, format='json')
+    assert resp.status_code == HTTP_201_CREATED
+    resp_json = resp.json()
+    assert resp_json['total'] == '100.00'
+    assert [position['name'] for position in resp_json['positions']] == [product.name for product in products]
+    assert Order.objects.get(pk=resp_json['id']).get_total_cost() == 100
+
+
+
+# тест на то, что цена позиции берется из БД, а не из устаревшего снимка каталога
+@pytest.mark.django_db
+def test_order_create_uses_current_price(api_user, product_factory):
+    product = product_factory(price=10)
+    assert catalogue.get(product.id).price == 10
+    # изменение в другом процессе: без сигналов, снимок этого процесса его не видит
+    Product.objects.filter(pk=product.pk).update(price=12)
+    resp = api_user.post(reverse('orders-list'), {'positions': [{'product_id': product.id, 'quantity': 2}]},
+                         format='json')
+    assert resp.status_code == HTTP_201_CREATED
+    assert (resp.json()['total'], resp.json()['positions'][0]['price']) == ('24.00', '12.00')
+
+
+# тест на то, что без снимка каталога названия позиций не запрашиваются по одной
+@pytest.mark.django_db
+def test_order_list_positions_without_catalogue(api_admin, order_factory, product_factory, settings):
+    settings.CATALOGUE_CACHE_ENABLED = False
+    order = order_factory(status='new')
+    ProductPosition.objects.create(order=order, product=product_factory())
+    url = reverse('orders-list')
+    with CaptureQueriesContext(connection) as context:
+        api_admin.get(url)
+    for product in product_factory(_quantity=4):
+        ProductPosition.objects.create(order=order_factory(status='new'), product=product)
+    with CaptureQueriesContext(connection) as more:
+        resp = api_admin.get(url)
+    assert len(resp.json()) == 5
+    assert all(position['name'] for item in resp.json() for position in item['positions'])
+    assert len(more) == len(context)
+
+
+# тест на заказ с несуществующим товаром
+@pytest.mark.django_db
+def test_order_create_unknown_product(api_user, product_factory):
+    product = product_factory()
+    order_payload = {'positions': [{'product_id': product.id + 100, 'quantity': 1}]}
+    resp = api_user.post(reverse('orders-list'), order_payload, format='json')
+    assert resp.status_code == HTTP_400_BAD_REQUEST
+    assert not Order.objects.exists()
+
+
+# тест на пакетное создание заказов
+@pytest.mark.django_db
+def test_order_bulk_create(api_user, product_factory):
+    products = product_factory(_quantity=3, price=5)
+    payload = [
+        {'positions': [{'product_id': product.id, 'quantity': quantity}]}
+        for quantity, product in enumerate(products, start=1)
+    ]
+    resp = api_user.post(reverse('orders-bulk-create'), payload, format='json')
+    assert resp.status_code == HTTP_201_CREATED
+    assert [order['total'] for order in resp.json()] == ['5.00', '10.00', '15.00']
+    assert ProductPosition.objects.count() == 3
+
+
+# тест на потоковую выгрузку заказов в NDJSON с фильтром
+@pytest.mark.django_db
+def test_order_export_ndjson(api_admin, order_factory, product_factory, monkeypatch):
+    monkeypatch.setattr(OrderViewSet, 'export_chunk_size', 2)
+    products = product_factory(_quantity=2, price=10)
+    orders = order_factory(_quantity=3, status='new')
+    order_factory(status='done')
+    for order in orders:
+        for product in products:
+            ProductPosition.objects.create(order=order, product=product)
+
+    resp = api_admin.get(reverse('orders-export'), {'status': 'new'})
+    assert resp.status_code == HTTP_200_OK
+    assert resp['Content-Type'] == 'application/x-ndjson'
+    lines = b''.join(resp.streaming_content).decode().splitlines()
+    records = [json.loads(line) for line in lines]
+    assert [record['id'] for record in records] == [order.id for order in orders]
+    assert all(len(record['positions']) == 2 for record in records)
+
+
+# тест на выгрузку заказов в CSV: строка на каждую позицию
+@pytest.mark.django_db
+def test_order_export_csv(api_admin, order_factory, product_factory):
+    order = order_factory(status='new')
+    for product in product_factory(_quantity=2, price=10):
+        ProductPosition.objects.create(order=order, product=product, quantity=3)
+
+    resp = api_admin.get(reverse('orders-export'), {'export_format': 'csv'})
+    rows = list(csv.DictReader(b''.join(resp.streaming_content).decode().splitlines()))
+    assert len(rows) == 2
+    assert rows[0]['id'] == str(order.id)
+    assert rows[0]['positions.quantity'] == '3'
+    assert rows[0]['total'] == '60.00'
+
+
 # тест на  создание заказа без авторизации
 @pytest.mark.django_db
 def test_order_create_no_auth(api_client, product_factory):
@@ -312,6 +638,27 @@ def test_order_update_admin(api_admin, order_prod_factory):
     assert resp_json['positions'][0]['quantity'] == new_quantity
 
 
+
+# тест на то, что замена позиций заказа не пересчитывает итог для каждой удаленной позиции
+@pytest.mark.django_db
+def test_order_update_replaces_positions_once(api_admin, order_factory, product_factory, settings):
+    settings.CATALOGUE_CACHE_ENABLED = False
+    product = product_factory(price=10)
+    url_counts = []
+    for old_positions in (1, 6):
+        order = order_factory(status='new')
+        for old_product in product_factory(_quantity=old_positions):
+            ProductPosition.objects.create(order=order, product=old_product, quantity=1)
+        url = reverse('orders-detail', args=(order.id,))
+        with CaptureQueriesContext(connection) as context:
+            resp = api_admin.patch(url, {'positions': [{'product_id': product.id, 'quantity': 3}]}, format='json')
+        assert resp.status_code == HTTP_200_OK
+        url_counts.append(len(context))
+        order.refresh_from_db()
+        assert (order.total, order.positions.count()) == (30, 1)
+    assert url_counts[0] == url_counts[1]
+
+
 # тест на изменение заказа юзером
 @pytest.mark.django_db
 def test_order_update_user(api_user, order_prod_factory):
@@ -354,6 +701,38 @@ def test_order_delete_user(api_user, order_factory):
     assert resp.status_code == HTTP_403_FORBIDDEN
 
 
+# тест на хранимую сумму заказа при изменении позиций
+@pytest.mark.django_db
+def test_order_total_follows_positions(order_factory, product_factory):
+    order = order_factory(status='new')
+    product = product_factory(price=100)
+    position = ProductPosition.objects.create(order=order, product=product, quantity=2)
+    order.refresh_from_db()
+    assert position.price == 100
+    assert order.total == 200
+
+    product.price = 150
+    product.save()
+    order.refresh_from_db()
+    assert order.total == 300
+    assert OrderSerializer(order).data['total'] == '300.00'
+
+    ProductPosition.objects.filter(pk=position.pk).delete()
+    order.refresh_from_db()
+    assert order.total == 0
+
+
+# тест на пересчет сумм заказов командой
+@pytest.mark.django_db
+def test_recalculate_order_totals_command(order_factory, product_factory):
+    order = order_factory(status='new')
+    ProductPosition.objects.create(order=order, product=product_factory(price=10), quantity=3)
+    type(order).objects.filter(pk=order.pk).update(total=0)
+    call_command('recalculate_order_totals')
+    order.refresh_from_db()
+    assert order.total == 30
+
+
 # ____________Tests for collections____________
 # тест на получение всех подборок
 @pytest.mark.django_db
@@ -364,6 +743,21 @@ def test_collection_list(api_client):
     assert resp.status_code == HTTP_200_OK
 
 
+# тест на сброс кэша подборок при изменении товаров подборки
+@pytest.mark.django_db
+def test_collection_cache_invalidated_by_m2m(api_client, collection_factory, product_factory):
+    collection = collection_factory()
+    product = product_factory()
+    url = reverse('collections-detail', args=(collection.id,))
+    assert api_client.get(url).json()['products'] == []
+
+    product.collection_set.add(collection)
+    assert api_client.get(url).json()['products'] == [product.id]
+
+    product.delete()
+    assert api_client.get(url).json()['products'] == []
+
+
 # тест на создание подборки админом
 @pytest.mark.django_db
 def test_collection_post_admin(api_admin, product_factory):
@@ -444,4 +838,742 @@ def test_collections_delete_user(api_user, collection_factory):
     collection = collection_factory()
     url = reverse('collections-detail', args=(collection.id,))
     resp = api_user.delete(url, {"id": collection.id})
-    assert resp.status_code == HTTP_403_FORBIDDEN
\ No newline at end of file
+    assert resp.status_code == HTTP_403_FORBIDDEN
+
+# ____________Tests for pagination____________
+# тест на постраничную выдачу товаров по курсору
+@pytest.mark.django_db
+def test_product_list_cursor_pages(api_client, product_factory, settings):
+    settings.PAGINATION_LIST_COMPAT = False
+    products = product_factory(_quantity=5)
+    url = reverse('products-list')
+    resp = api_client.get(url, {'page_size': 2})
+    assert resp.status_code == HTTP_200_OK
+    resp_json = resp.json()
+    assert [item['id'] for item in resp_json['results']] == [products[0].id, products[1].id]
+
+    seen = []
+    next_url = url + '?page_size=2'
+    while next_url:
+        resp_json = api_client.get(next_url).json()
+        seen.extend(item['id'] for item in resp_json['results'])
+        next_url = resp_json['next']
+    assert seen == [product.id for product in products]
+
+
+# тест на режим совместимости: список в теле, курсор в заголовке Link
+@pytest.mark.django_db
+def test_product_list_compat_link_header(api_client, product_factory):
+    product_factory(_quantity=3)
+    url = reverse('products-list')
+    resp = api_client.get(url, {'page_size': 2})
+    assert resp.status_code == HTTP_200_OK
+    assert len(resp.json()) == 2
+    assert 'rel="next"' in resp['Link']
+
+
+# тест на EXPLAIN комбинаций фильтров
+@pytest.mark.django_db
+def test_explain_filters_command(capsys):
+    call_command('explain_filters', depth=1)
+    out = capsys.readouterr().out
+    assert '[OK] products price_from=100' in out
+    assert '[OK] orders status=new' in out
+
+
+# ____________Tests for query budget____________
+# тест на бюджет запросов списка товаров
+@pytest.mark.django_db
+def test_product_list_query_budget(api_client, product_factory, assert_query_budget):
+    product_factory(_quantity=5)
+    resp = api_client.get(reverse('products-list'))
+    report = assert_query_budget(resp)
+    assert report['view'] == 'ProductViewSet'
+    assert report['action'] == 'list'
+    assert report['queries'] <= report['budget']
+
+
+# тест на бюджет запросов списка заказов с позициями
+@pytest.mark.django_db
+def test_order_list_query_budget(api_client, order_factory, product_factory, assert_query_budget):
+    order = order_factory(status='new')
+    api_client.force_authenticate(order.creator)
+    for product in product_factory(_quantity=3):
+        ProductPosition.objects.create(order=order, product=product)
+    resp = api_client.get(reverse('orders-list'))
+    assert resp.status_code == HTTP_200_OK
+    assert_query_budget(resp)
+
+
+# тест на обнаружение N+1 с указанием поля сериализатора
+@pytest.mark.django_db
+def test_query_counter_reports_n_plus_one(order_factory, product_factory, settings):
+    settings.CATALOGUE_CACHE_ENABLED = False
+    order = order_factory(status='new')
+    for product in product_factory(_quantity=3):
+        ProductPosition.objects.create(order=order, product=product)
+    with QueryCounter() as counter:
+        OrderSerializer(Order.objects.all(), many=True).data
+    repeated = counter.repeated(threshold=3)
+    assert len(repeated) == 1
+    assert repeated[0]['count'] == 3
+    assert repeated[0]['source'] == ['ProductPositionSerializer.name']
+
+
+
+# ____________Tests for benchmark____________
+# тест на прогон бенчмарка на маленьком объеме данных
+@pytest.mark.django_db
+def test_benchmark_api_command(tmp_path):
+    output = tmp_path / 'bench.json'
+    call_command('benchmark_api', products=5, orders=3, positions=10, reviews=5, collections=2,
+                 requests=2, output=str(output))
+    results = json.loads(output.read_text())
+    assert results['meta']['volumes']['products'] == 5
+    assert results['scenarios']['products-list']['errors'] == 0
+    assert {'p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request', 'peak_memory_kb'} <= set(results['scenarios']['orders-list'])
+    assert not Product.objects.exists()
+
+
+
+# ____________Tests for replica routing____________
+# тест на чтение с реплики и закрепление за основной БД после записи
+@pytest.mark.django_db
+def test_replica_routing_sticks_to_primary_after_write(rf, settings):
+    settings.DATABASE_REPLICAS = ['replica']
+    router = ReplicaRouter()
+    routed = []
+
+    def view(request):
+        routed.append(router.db_for_read(Product))
+        if request.method == 'POST':
+            router.db_for_write(Product)
+            routed.append(router.db_for_read(Product))
+        return HttpResponse()
+
+    middleware = ReplicaRoutingMiddleware(view)
+    middleware(rf.get('/api/products/'))
+    response = middleware(rf.post('/api/orders/'))
+    assert routed == ['replica', 'default', 'default']
+
+    request = rf.get('/api/orders/')
+    request.COOKIES[PIN_COOKIE] = response.cookies[PIN_COOKIE].value
+    middleware(request)
+    assert routed[-1] == 'default'
+
+    settings.REPLICA_STICKY_SECONDS = 0
+    middleware(rf.get('/api/orders/'))
+    assert routed[-1] == 'replica'
+    assert router.db_for_read(Product) == 'default'
+
+
+
+# тест на то, что запросы через API действительно идут в alias реплики и основной БД
+@pytest.mark.django_db(transaction=True, databases=['default', 'replica'])
+def test_replica_routing_uses_database_aliases(api_admin, product_factory, settings):
+    settings.DATABASE_REPLICAS = ['replica']
+    settings.CATALOGUE_CACHE_ENABLED = False
+    product = product_factory()
+    url = reverse('products-list')
+
+    def run(method, *args, **kwargs):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            resp = getattr(api_admin, method)(*args, **kwargs)
+        assert resp.status_code < 400
+        return resp, len(primary), len(replica)
+
+    resp, primary, replica = run('get', url)
+    assert [item['id'] for item in resp.json()] == [product.id]
+    assert (primary, replica > 0) == (0, True)
+
+    _, primary, replica = run('post', url, {'name': 'Новый', 'desc': 'd', 'price': 10})
+    assert (primary > 0, replica) == (True, 0)
+
+    # после записи клиент читает с основной БД
+    resp, primary, replica = run('get', url)
+    assert len(resp.json()) == 2
+    assert (primary > 0, replica) == (True, 0)
+
+
+
+# ____________Tests for connection pool____________
+# тест на переиспользование, лимит, проверку и пересоздание соединений пула
+def test_connection_pool_reuses_and_recycles_connections():
+    opened, broken = [], set()
+
+    def connect():
+        opened.append(object())
+        return opened[-1]
+
+    pool = ConnectionPool(connect=connect, check=lambda conn: conn not in broken, reset=lambda conn: True,
+                          close=lambda conn: None, min_size=1, max_size=2, timeout=0.01,
+                          max_idle=300, max_lifetime=3600, check_interval=0)
+    pool.warm()
+    first = pool.acquire()
+    second = pool.acquire()
+    assert len(opened) == 2
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+
+    pool.release(first)
+    assert pool.acquire() is first
+
+    broken.add(second)
+    pool.release(second)
+    assert pool.acquire() is not second
+    stats = pool.stats()
+    assert stats['created'] == 3
+    assert stats['health_check_failures'] == 1
+    assert stats['timeouts'] == 1
+    assert stats['in_use'] == 2
+
+
+# тест на доступ к метрикам пула только для администратора
+@pytest.mark.django_db
+def test_db_pool_stats_admin_only(api_client, api_admin):
+    url = reverse('db-pool')
+    assert api_client.get(url).status_code == HTTP_403_FORBIDDEN
+    assert api_admin.get(url).status_code == HTTP_200_OK
+
+
+
+# ____________Tests for ASGI benchmark____________
+# тест на прогон одних и тех же адресов через WSGI и ASGI обработчики
+@pytest.mark.django_db(transaction=True)
+def test_benchmark_asgi(product_factory, collection_factory, tmp_path):
+    collection_factory(products=product_factory(_quantity=3))
+
+    output = tmp_path / 'asgi.json'
+    call_command('benchmark_asgi', concurrency=2, requests=4, output=str(output))
+    results = json.loads(output.read_text())
+    for handler in ('wsgi', 'asgi'):
+        for url in ('/api/products/', '/api/collections/'):
+            assert results[handler][url]['requests'] == 4
+            assert results[handler][url]['errors'] == 0
+            assert results[handler][url]['rps'] > 0
+
+
+
+# ____________Tests for catalogue snapshot____________
+# тест на карточку товара из снимка каталога без запросов к БД
+@pytest.mark.django_db
+def test_product_retrieve_from_catalogue(api_user, product_factory):
+    product = product_factory()
+    url = reverse('products-detail', args=(product.pk,))
+    assert api_user.get(url).json() == ProductSerializer(Product.objects.get(pk=product.pk)).data
+    with QueryCounter() as counter:
+        resp = api_user.get(url)
+    assert resp.status_code == HTTP_200_OK
+    assert counter.count == 0
+    assert api_user.get(reverse('products-detail', args=(product.pk + 100,))).status_code == HTTP_404_NOT_FOUND
+
+
+# тест на догрузку изменений из других процессов по updated_at и удаление товаров
+@pytest.mark.django_db
+def test_catalogue_incremental_refresh(product_factory, settings):
+    first, second = product_factory(_quantity=2)
+    catalogue.load()
+    stale = catalogue.get(second.pk)
+    settings.CATALOGUE_REFRESH_SECONDS = 0
+
+    # изменения без сигналов в этом процессе, как их видит другой процесс
+    Product.objects.filter(pk=first.pk).update(name='Обновленный')
+    Product.objects.filter(pk=first.pk).touch()
+    Product.objects.filter(pk=second.pk).delete()
+    catalogue._records[second.pk] = stale
+
+    assert catalogue.get(first.pk).name == 'Обновленный'
+    assert second.pk not in catalogue.get_many([first.pk])
+    stats = catalogue.stats()
+    assert stats['refreshes'] == 2
+    assert stats['hits'] == 3
+    assert stats['misses'] == 0
+
+
+# тест на цену позиции из БД (один запрос) и название из снимка каталога
+@pytest.mark.django_db
+def test_order_positions_priced_from_catalogue(api_user, product_factory):
+    product = product_factory(price=100)
+    catalogue.load()
+    with QueryCounter() as counter:
+        resp = api_user.post(reverse('orders-list'), {'positions': [{'product_id': product.pk, 'quantity': 2}]},
+                             format='json')
+    assert resp.status_code == HTTP_201_CREATED
+    assert resp.json()['total'] == '200.00'
+    assert resp.json()['positions'][0]['name'] == product.name
+    assert len([query for query in counter.queries if 'FROM "app_product"' in query['shape']]) == 1
+
+
+
+# ____________Tests for collection membership____________
+# тест на хранимое количество товаров подборки при изменении M2M и удалении товара
+@pytest.mark.django_db
+def test_collection_product_count(collection_factory, product_factory):
+    collection = collection_factory()
+    products = product_factory(_quantity=3)
+    collection.products.add(*products)
+    assert collection.product_count == 3
+    products[0].collection_set.remove(collection)
+    products[1].delete()
+    collection.refresh_from_db()
+    assert collection.product_count == 1
+    products[2].collection_set.clear()
+    collection.refresh_from_db()
+    assert collection.product_count == 0
+
+
+# тест на id товаров подборок без чтения таблицы товаров и на режим expand
+@pytest.mark.django_db
+def test_collection_list_reads_through_table(api_client, collection_factory, product_factory):
+    products = product_factory(_quantity=3)
+    collection_factory(products=products, _quantity=2)
+    with QueryCounter() as counter:
+        resp = api_client.get(reverse('collections-list'))
+    assert resp.status_code == HTTP_200_OK
+    assert [item['products'] for item in resp.json()] == [sorted(product.pk for product in products)] * 2
+    assert [item['product_count'] for item in resp.json()] == [3, 3]
+    assert counter.count == 2
+    assert not [query for query in counter.queries if 'FROM "app_product"' in query['shape']]
+
+    resp = api_client.get(reverse('collections-list'), {'expand': 'products'})
+    assert resp.json()[0]['products'][0] == {'id': products[0].pk, 'name': products[0].name,
+                                             'price': '{:.2f}'.format(products[0].price)}
+
+
+# тест на постраничный вывод товаров подборки
+@pytest.mark.django_db
+def test_collection_products_pages(api_client, collection_factory, product_factory):
+    products = product_factory(_quantity=5)
+    collection = collection_factory(products=products)
+    url = reverse('collections-products', args=(collection.pk,))
+    resp = api_client.get(url, {'page_size': 2})
+    assert resp.status_code == HTTP_200_OK
+    assert [item['id'] for item in resp.json()] == sorted(product.pk for product in products)[:2]
+    next_url = resp['Link'].split(';')[0].strip('<>')
+    resp = api_client.get(next_url)
+    assert [item['id'] for item in resp.json()] == sorted(product.pk for product in products)[2:4]
+
+
+
+# ____________Tests for sparse fieldsets____________
+# тест на ?fields= для товаров: в ответе и в SQL только нужные колонки
+@pytest.mark.django_db
+def test_product_list_sparse_fields(api_client, product_factory):
+    product_factory(_quantity=3)
+    with QueryCounter() as counter:
+        resp = api_client.get(reverse('products-list'), {'fields': 'id,name,price'})
+    assert resp.status_code == HTTP_200_OK
+    assert [set(item) for item in resp.json()] == [{'id', 'name', 'price'}] * 3
+    assert counter.count == 1
+    assert '"desc"' not in counter.queries[0]['shape']
+    resp = api_client.get(reverse('products-list'), {'fields': 'id,secret'})
+    assert resp.status_code == HTTP_400_BAD_REQUEST
+
+
+# тест на ?fields= для заказов: без join пользователя и prefetch позиций
+@pytest.mark.django_db
+def test_order_list_sparse_fields(api_admin, order_factory):
+    order_factory(status='new', _quantity=2)
+    with QueryCounter() as counter:
+        resp = api_admin.get(reverse('orders-list'), {'fields': 'id,status,total'})
+    assert [set(item) for item in resp.json()] == [{'id', 'status', 'total'}] * 2
+    assert counter.count == 1
+    assert 'auth_user' not in counter.queries[0]['shape']
+
+
+# тест на ?expand= для отзывов: вложенные товар и автор одним запросом
+@pytest.mark.django_db
+def test_review_list_expand(api_user, product_factory, user):
+    product = product_factory()
+    ProductReview.objects.create(review_product=product, creator=user, text='text', rating=5)
+    with QueryCounter() as counter:
+        resp = api_user.get(reverse('reviews-list'), {'expand': 'review_product,creator', 'fields': 'id,review_product,creator'})
+    assert resp.status_code == HTTP_200_OK
+    assert resp.json() == [{
+        'id': ProductReview.objects.get().pk,
+        'review_product': {'id': product.pk, 'name': product.name, 'price': '{:.2f}'.format(product.price)},
+        'creator': {'id': user.pk, 'username': user.username},
+    }]
+    assert counter.count == 1
+
+
+
+# ____________Tests for fast list serialization____________
+# тест на побайтовое совпадение быстрого и обычного list для товаров, отзывов и подборок
+@pytest.mark.django_db
+def test_fast_list_matches_serializers(api_admin, settings, product_factory, collection_factory, django_user_model):
+    products = product_factory(_quantity=4, name='Товар \u2028 "кавычки"')
+    users = [django_user_model.objects.create_user(username='u{}'.format(i)) for i in range(3)]
+    for i, user in enumerate(users):
+        ProductReview.objects.create(review_product=products[i], creator=user, text='Отзыв {}'.format(i), rating=i + 3)
+    collection_factory(products=products[:3])
+    collection_factory()
+
+    urls = [
+        (reverse('products-list'), {}),
+        (reverse('products-list'), {'fields': 'id,name,price,rating_histogram', 'ordering': '-price'}),
+        (reverse('products-list'), {'page_size': 2}),
+        (reverse('reviews-list'), {}),
+        (reverse('reviews-list'), {'fields': 'id,rating,review_product'}),
+        (reverse('collections-list'), {}),
+    ]
+    for url, params in urls:
+        settings.FAST_SERIALIZER_ENABLED = True
+        fast = api_admin.get(url, params)
+        settings.FAST_SERIALIZER_ENABLED = False
+        slow = api_admin.get(url, params)
+        assert isinstance(fast.accepted_renderer, NativeJSONRenderer)
+        assert fast.status_code == slow.status_code == HTTP_200_OK
+        assert fast.content == slow.content
+        assert fast.get('Link') == slow.get('Link')
+
+
+# ____________Tests for order product filter____________
+# тест на фильтр заказов по названию и id товара: без дублей и со всеми позициями заказа
+@pytest.mark.django_db
+def test_order_filter_by_products(api_admin, order_factory, product_factory, django_assert_num_queries):
+    kettle, lamp, chair = product_factory(name='Чайник'), product_factory(name='Лампа'), product_factory(name='Стул')
+    first, second, third = order_factory(_quantity=3, status='new')
+    for order, products in ((first, (kettle, kettle, lamp)), (second, (lamp,)), (third, (chair,))):
+        for product in products:
+            ProductPosition.objects.create(order=order, product=product)
+
+    url = reverse('orders-list')
+    resp = api_admin.get(url, {'products': 'Чайник'})
+    assert [item['id'] for item in resp.json()] == [first.id]
+    assert len(resp.json()[0]['positions']) == 3
+    resp = api_admin.get(url, {'products': '{},Стул'.format(lamp.id)})
+    assert sorted(item['id'] for item in resp.json()) == sorted([first.id, second.id, third.id])
+    assert api_admin.get(url, {'products': 'Нет такого'}).json() == []
+
+    queryset = OrderViewSet.filterset_class({'products': 'Чайник,{}'.format(chair.id)}, Order.objects.all()).qs
+    assert 'EXISTS' in str(queryset.query)
+    with django_assert_num_queries(1):
+        assert sorted(queryset.values_list('pk', flat=True)) == sorted([first.id, third.id])
+
+
+
+# тест на то, что значения вроде '²' и слишком большие числа в фильтре не приводят к ошибке 500
+@pytest.mark.django_db
+def test_order_filter_by_products_not_ascii_digits(api_admin, order_factory, product_factory):
+    product = product_factory(name='²')
+    order = order_factory(status='new')
+    ProductPosition.objects.create(order=order, product=product)
+    url = reverse('orders-list')
+    resp = api_admin.get(url, {'products': '²'})
+    assert resp.status_code == HTTP_200_OK
+    assert [item['id'] for item in resp.json()] == [order.id]
+    for value in ('١٢', '9' * 30):
+        resp = api_admin.get(url, {'products': value})
+        assert resp.status_code == HTTP_200_OK
+        assert resp.json() == []
+
+
+# тест на ограничение числа товаров в фильтре заказов
+@pytest.mark.django_db
+def test_order_filter_by_products_limit(api_admin):
+    resp = api_admin.get(reverse('orders-list'), {'products': ','.join(str(i) for i in range(1, 102))})
+    assert resp.status_code == HTTP_400_BAD_REQUEST
+
+
+# ____________Tests for sales reports____________
+def sales_snapshot(model):
+    return sorted(model.objects.values_list('period', 'product_id', 'status', 'revenue', 'units', 'orders'))
+
+
+# тест на обновление сводок продаж при изменении заказов и на совпадение с полным пересчетом
+@pytest.mark.django_db
+def test_sales_rollups_follow_orders(api_admin, product_factory):
+    first, second = product_factory(price=10), product_factory(price=25)
+    # тест идет в транзакции, и on_commit не срабатывает: задачи ставятся явно
+    resp = api_admin.post(reverse('orders-list'), {'positions': [
+        {'product_id': first.id, 'quantity': 2}, {'product_id': second.id, 'quantity': 1},
+    ]}, format='json')
+    other = api_admin.post(reverse('orders-list'), {'positions': [{'product_id': first.id, 'quantity': 3}]},
+                           format='json').json()
+    flush_sales()
+    # задача на каждую пару (час, товар): второй заказ того же товара к ней сводится
+    assert sorted(Job.objects.values_list('payload__product_id', 'status')) == [(first.id, 'queued'), (second.id, 'queued')]
+    assert not DailySales.objects.exists()
+    assert Worker().run_once() == 2
+    order_id = resp.json()['id']
+    rows = {(row.product_id, row.status): (row.revenue, row.units, row.orders) for row in DailySales.objects.all()}
+    assert rows == {(first.id, 'new'): (50, 5, 2), (second.id, 'new'): (25, 1, 1)}
+    assert sales_snapshot(HourlySales) and {row[1:] for row in sales_snapshot(HourlySales)} == {row[1:] for row in sales_snapshot(DailySales)}
+
+    for status in ('in_progress', 'done'):
+        api_admin.patch(reverse('orders-detail', args=(order_id,)), {'status': status}, format='json')
+    Order.objects.get(pk=other['id']).delete()
+    flush_sales()
+    Worker().run_once()
+    rows = {(row.product_id, row.status): (row.revenue, row.units, row.orders) for row in DailySales.objects.all()}
+    assert rows == {(first.id, 'done'): (20, 2, 1), (second.id, 'done'): (25, 1, 1)}
+
+    daily, hourly = sales_snapshot(DailySales), sales_snapshot(HourlySales)
+    DailySales.objects.all().delete()
+    HourlySales.objects.all().delete()
+    output = io.StringIO()
+    call_command('rebuild_sales_rollups', stdout=output)
+    assert 'Пересчитано периодов' in output.getvalue()
+    assert (sales_snapshot(DailySales), sales_snapshot(HourlySales)) == (daily, hourly)
+
+    # замена позиций: строки товара, которого больше нет в заказе, тоже пересчитываются
+    resp = api_admin.patch(reverse('orders-detail', args=(order_id,)),
+                           {'positions': [{'product_id': second.id, 'quantity': 1}]}, format='json')
+    assert resp.status_code == HTTP_200_OK
+    flush_sales()
+    Worker().run_once()
+    assert sales_snapshot(DailySales) == [row for row in daily if row[1] == second.id]
+
+
+# тест на отчет по продажам из сводок одним запросом
+@pytest.mark.django_db
+def test_sales_report(api_admin, api_user, product_factory, assert_query_budget):
+    first, second = product_factory(_quantity=2)
+    day = timezone.make_aware(datetime(2026, 10, 1))
+    DailySales.objects.create(period=day, product=first, status='new', revenue=100, units=4, orders=2)
+    DailySales.objects.create(period=day, product=second, status='done', revenue=30, units=1, orders=1)
+    HourlySales.objects.create(period=day, product=first, status='new', revenue=100, units=4, orders=2)
+    url = reverse('reports-sales')
+
+    resp = api_admin.get(url, {'status': 'new', 'date_from': '2026-10-01T00:00:00Z'})
+    assert_query_budget(resp)
+    assert resp.json() == [{'period': '2026-10-01T00:00:00Z', 'product': first.id, 'status': 'new',
+                            'revenue': '100.00', 'units': 4, 'orders': 2}]
+    assert len(api_admin.get(url, {'product': '{},{}'.format(first.id, second.id)}).json()) == 2
+    assert len(api_admin.get(url, {'grain': 'hour'}).json()) == 1
+    assert api_admin.get(url, {'grain': 'week'}).status_code == HTTP_400_BAD_REQUEST
+    assert api_user.get(url).status_code == HTTP_403_FORBIDDEN
+
+
+# ____________Tests for order status transitions____________
+# тест на массовую смену статуса: один UPDATE с условием на текущий статус и результат по каждому id
+@pytest.mark.django_db
+def test_order_bulk_status(api_admin, api_user, order_factory, django_assert_max_num_queries):
+    new, progress, done = order_factory(status='new'), order_factory(status='in_progress'), order_factory(status='done')
+    url = reverse('orders-bulk-status')
+
+    with django_assert_max_num_queries(5):
+        resp = api_admin.post(url, {'status': 'in_progress', 'ids': [new.id, progress.id, done.id, 0]}, format='json')
+    assert resp.status_code == HTTP_200_OK
+    assert resp.json() == [
+        {'id': new.id, 'result': 'updated', 'status': 'in_progress'},
+        {'id': progress.id, 'result': 'unchanged', 'status': 'in_progress'},
+        {'id': done.id, 'result': 'invalid_transition', 'status': 'done'},
+        {'id': 0, 'result': 'not_found', 'status': None},
+    ]
+    updated_at = Order.objects.get(pk=new.id).updated_at
+    assert updated_at > new.updated_at
+    assert sorted(Order.objects.open().values_list('pk', flat=True)) == sorted([new.id, progress.id])
+    assert [item['id'] for item in api_admin.get(reverse('orders-list'), {'open': 'false'}).json()] == [done.id]
+
+    assert api_admin.post(url, {'status': 'new', 'ids': [new.id]}, format='json').status_code == HTTP_400_BAD_REQUEST
+    assert api_admin.post(url, {'status': 'done', 'ids': 'all'}, format='json').status_code == HTTP_400_BAD_REQUEST
+    assert api_user.post(url, {'status': 'done', 'ids': [new.id]}, format='json').status_code == HTTP_403_FORBIDDEN
+    assert Order.objects.create(creator=new.creator).status == 'new'
+
+
+# тест на смену статуса через создание и изменение заказа только по Order.TRANSITIONS
+@pytest.mark.django_db
+def test_order_status_follows_transitions(api_admin, order_factory, product_factory):
+    product = product_factory(price=10)
+    positions = [{'product_id': product.id, 'quantity': 1}]
+    resp = api_admin.post(reverse('orders-list'), {'status': 'done', 'positions': positions}, format='json')
+    assert resp.status_code == HTTP_400_BAD_REQUEST
+    assert 'status' in resp.json()
+
+    order = order_factory(status='new')
+    url = reverse('orders-detail', args=(order.id,))
+    assert api_admin.patch(url, {'status': 'done'}, format='json').status_code == HTTP_400_BAD_REQUEST
+    for status in ('new', 'in_progress', 'in_progress', 'done'):
+        resp = api_admin.patch(url, {'status': status}, format='json')
+        assert resp.status_code == HTTP_200_OK
+        assert resp.json()['status'] == status
+    assert api_admin.patch(url, {'status': 'new'}, format='json').status_code == HTTP_400_BAD_REQUEST
+    order.refresh_from_db()
+    assert order.status == 'done'
+
+
+# ____________Tests for job queue____________
+# тест на дедупликацию задач по ключу и постановку только после коммита
+@pytest.mark.django_db
+def test_job_queue_dedup(monkeypatch):
+    calls = []
+    monkeypatch.setitem(TASKS, 'tests.collect', (lambda value: calls.append(value), 3))
+
+    first = create_job('tests.collect', key='same', value=1)
+    assert create_job('tests.collect', key='same', value=2) is None
+    create_job('tests.collect', value=3)
+    assert Worker(concurrency=1).run_once() == 2
+    assert sorted(calls) == [1, 3]
+    assert create_job('tests.collect', key='same', value=4).pk != first.pk
+    with pytest.raises(ValueError):
+        create_job('tests.unknown')
+
+
+# тест на повторы с задержкой и перевод задачи в failed после последней попытки
+@pytest.mark.django_db
+def test_job_queue_retries(monkeypatch):
+    def flaky():
+        raise RuntimeError('boom')
+    monkeypatch.setitem(TASKS, 'tests.flaky', (flaky, 2))
+    job = create_job('tests.flaky')
+
+    assert Worker().run_once() == 1
+    job.refresh_from_db()
+    assert (job.status, job.attempts) == ('queued', 1)
+    assert job.run_at > timezone.now() and 'boom' in job.last_error
+    assert Worker().run_once() == 0
+
+    Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+    output = io.StringIO()
+    call_command('run_jobs', '--once', '--concurrency', '1', stdout=output)
+    assert 'Выполнено задач: 1' in output.getvalue()
+    job.refresh_from_db()
+    assert (job.status, job.attempts) == ('failed', 2)
+
+
+
+# тест на возврат зависших задач с одним ключом и на итог задачи, которую уже забрал другой воркер
+@pytest.mark.django_db
+def test_job_queue_requeue_stale(monkeypatch):
+    calls = []
+    monkeypatch.setitem(TASKS, 'tests.collect', (lambda value: calls.append(value), 3))
+    first = create_job('tests.collect', key='same', value=1)
+    slow, = claim('worker-1', 1)
+    second = create_job('tests.collect', key='same', value=2)
+    claim('worker-2', 1)
+    Job.objects.filter(pk__in=[first.pk, second.pk]).update(locked_at=timezone.now() - timedelta(hours=1))
+
+    assert requeue_stale() == 2
+    assert sorted(Job.objects.values_list('status', flat=True)) == ['done', 'queued']
+    # первый воркер закончил после возврата задачи в очередь: ее состояние не меняется
+    run_job(slow)
+    assert calls == [1]
+    assert Job.objects.get(pk=first.pk).status == 'queued'
+
+
+# ____________Tests for admin____________
+def count_queries(client, url):
+    with CaptureQueriesContext(connection) as context:
+        assert client.get(url).status_code == HTTP_200_OK
+    return len(context)
+
+
+# тест на то, что число запросов страниц админки не растет с числом строк и товаров
+@pytest.mark.django_db
+def test_admin_queries_do_not_grow(admin_client, admin_user, order_factory, product_factory, django_user_model):
+    def add_rows(index):
+        product = product_factory()
+        order = order_factory(status='new')
+        ProductPosition.objects.create(order=order, product=product)
+        ProductReview.objects.create(review_product=product, text='ok', rating=3,
+                                     creator=django_user_model.objects.create_user(username='admin{}'.format(index)))
+        return order
+
+    order = add_rows(0)
+    urls = [reverse('admin:app_order_changelist'), reverse('admin:app_productreview_changelist'),
+            reverse('admin:app_order_change', args=(order.pk,))]
+    before = [count_queries(admin_client, url) for url in urls]
+    for index in range(1, 6):
+        add_rows(index)
+    ProductPosition.objects.create(order=order, product=product_factory())
+    assert [count_queries(admin_client, url) for url in urls] == before
+    # список не сканирует таблицу агрегатами по датам (date_hierarchy)
+    for url in urls[:2]:
+        with CaptureQueriesContext(connection) as context:
+            admin_client.get(url)
+        assert not [query for query in context.captured_queries if 'MIN(' in query['sql'] or 'MAX(' in query['sql']]
+    # виджет товара в позициях не выводит весь каталог
+    product_factory(name='Товар не из заказа')
+    assert 'Товар не из заказа' not in admin_client.get(urls[2]).content.decode()
+
+
+# тест на оценку числа строк вместо COUNT(*) для списка без фильтров
+@pytest.mark.django_db
+def test_estimated_count_paginator(order_factory, monkeypatch):
+    order_factory(_quantity=3, status='new')
+    assert EstimatedCountPaginator(Order.objects.all(), 2).count == 3
+    monkeypatch.setattr(EstimatedCountPaginator, 'estimate', lambda self, queryset: 1000000)
+    assert EstimatedCountPaginator(Order.objects.all(), 2).count == 1000000
+    assert EstimatedCountPaginator(Order.objects.filter(status='new'), 2).count == 3
+
+
+# ____________Tests for catalogue import____________
+# тест на создание товаров по артикулу, добавление в подборки и обновление при повторном импорте
+@pytest.mark.django_db
+def test_catalogue_import_upsert(collection_factory, order_factory):
+    first, second = collection_factory(_quantity=2)
+    data = ('sku,name,desc,price,collections\n'
+            'A-1,Чай,черный,100,{0}|{1}\n'
+            'A-2,Кофе,,250.50,{1}\n').format(first.pk, second.pk)
+    report = import_products(io.StringIO(data), chunk_size=1)
+    assert (report.rows, report.created, report.updated, report.failed) == (2, 2, 0, 0)
+    tea = Product.objects.get(sku='A-1')
+    assert (tea.name, tea.price, tea.created_at is not None) == ('Чай', 100, True)
+    assert list(Collection.objects.order_by('pk').values_list('product_count', flat=True)) == [1, 2]
+    assert set(second.products.values_list('sku', flat=True)) == {'A-1', 'A-2'}
+
+    order = order_factory(status='new')
+    ProductPosition.objects.create(order=order, product=tea, quantity=2)
+    data = 'sku,name,desc,price,collections\nA-1,Чай,черный,120,{0}\nA-2,Кофе,,250.50,\n'.format(first.pk)
+    report = import_products(io.StringIO(data))
+    assert (report.created, report.updated, report.unchanged, report.failed) == (0, 1, 1, 0)
+    assert Product.objects.count() == 2
+    assert Product.objects.get(sku='A-1').price == 120
+    # цена обновляется и в открытых заказах
+    order.refresh_from_db()
+    assert order.total == 240
+
+
+# тест на то, что ошибки строк попадают в отчет и не прерывают импорт
+@pytest.mark.django_db
+def test_catalogue_import_row_errors():
+    data = '\n'.join([
+        json.dumps({'sku': 'B-1', 'name': 'Сахар', 'price': '-1'}),
+        '{"sku": "B-2",',
+        json.dumps({'sku': 'B-3', 'name': 'Соль', 'price': '10', 'collections': [999]}),
+        json.dumps({'sku': 'B-4', 'name': 'Перец', 'price': '15'}),
+        json.dumps({'sku': 'B-4', 'name': 'Перец черный', 'price': '15'}),
+    ])
+    report = import_products(io.StringIO(data), 'ndjson').as_dict()
+    assert (report['rows'], report['created'], report['failed'], report['superseded']) == (5, 1, 3, 1)
+    assert report['rows'] == report['created'] + report['updated'] + report['unchanged'] + report['failed'] + 1
+    assert [error['line'] for error in report['errors']] == [1, 2, 3]
+    assert Product.objects.get(sku='B-4').name == 'Перец черный'
+    assert list(Product.objects.values_list('sku', flat=True)) == ['B-4']
+
+
+# тест на импорт каталога через очередь задач (только администратор) и командой
+@pytest.mark.django_db
+def test_catalogue_import_endpoint_and_command(api_admin, api_user, tmp_path, settings):
+    settings.CATALOGUE_IMPORT_DIR = tmp_path / 'imports'
+    url = reverse('products-import-catalogue')
+    body = json.dumps({'sku': 'C-1', 'name': 'Мед', 'price': '300'}).encode()
+    upload = SimpleUploadedFile('catalogue.ndjson', body)
+    assert api_user.post(url, {'file': upload}, format='multipart').status_code == HTTP_403_FORBIDDEN
+    upload = SimpleUploadedFile('catalogue.txt', body)
+    assert api_admin.post(url, {'file': upload}, format='multipart').status_code == HTTP_400_BAD_REQUEST
+    upload = SimpleUploadedFile('catalogue.ndjson', body)
+    resp = api_admin.post(url, {'file': upload}, format='multipart')
+    assert resp.status_code == HTTP_202_ACCEPTED
+    status_url = reverse('products-import-status', args=(resp.json()['job'],))
+    assert api_admin.get(status_url).json()['status'] == 'queued'
+    assert not Product.objects.exists()
+
+    assert Worker().run_once() == 1
+    state = api_admin.get(status_url).json()
+    assert state['status'] == 'done'
+    assert (state['report']['created'], state['report']['failed']) == (1, 0)
+    assert Product.objects.get(sku='C-1').name == 'Мед'
+    # загруженный файл удаляется после импорта
+    assert not list((tmp_path / 'imports').iterdir())
+    assert api_user.get(status_url).status_code == HTTP_403_FORBIDDEN
+
+    path = tmp_path / 'catalogue.csv'
+    path.write_text('\ufeffsku,name,price\nC-1,Мед липовый,300\nC-2,Джем,150\n', encoding='utf-8')
+    output = tmp_path / 'report.json'
+    call_command('import_catalogue', str(path), output=str(output), stdout=io.StringIO())
+    assert json.loads(output.read_text())['created'] == 1
+    assert dict(Product.objects.values_list('sku', 'name')) == {'C-1': 'Мед липовый', 'C-2': 'Джем'}